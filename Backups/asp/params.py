@@ -1,2 +1,29 @@
 primary=['asp/graph_based/actions.lp','asp/graph_based/graph.lp','asp/graph_based/traverse.lp']
 secondary=[]
+# write facts through clingo's backend instead of parsing them as text
+inject=True
+# add reachable/4 facts for pruned encodings such as asp/flat_pruned.lp
+prune=False
+# keep one grounded clingo control for all replans of a simulation
+persistent=False
+# ground one timestep at a time until a plan exists, for incremental encodings such as asp/flat_inc.lp
+incremental=False
+# add trans/4 and succ/5 facts decoded from the track IDs, for encodings such as asp/flat_succ.lp
+successors=False
+# reuse ground programs of earlier runs on the same environment, stored in tmp/ground
+cache=False
+# maximum size of tmp/ground in bytes, least recently used programs are removed first
+cache_size=512*1024**2
+# number of threads clingo solves with
+threads=1
+# clingo's solver configuration: auto, frumpy, jumpy, tweety, handy, crafty, trendy or many
+configuration='auto'
+# clingo's optimization strategy: bb or usc, optionally with tactics such as 'usc,oll'
+opt_strategy='bb'
+# (configuration, opt_strategy) pairs raced in separate single-threaded processes, empty to disable racing
+# e.g. [('frumpy','bb'), ('jumpy','usc'), ('tweety','bb'), ('crafty','usc')]
+portfolio=[]
+# seconds to optimize the initial plan and each replan, the best plan found so far is used when they run out
+# None waits for the first model, as before
+budget=None
+replan_budget=None
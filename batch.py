@@ -0,0 +1,229 @@
+# standard packages
+import os
+import glob
+import time
+import resource
+import traceback
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from argparse import ArgumentParser, Namespace
+
+# custom modules
+from asp import params
+from solve import check_params, build_manager, simulate, OutputLogManager
+from modules.render import FrameWriter, render_states
+from modules.actionlist import build_action_list
+from modules.api import solve_anytime, load_encoding
+from modules.portfolio import solver_options
+from modules.envfile import load_env
+
+# clingo
+import clingo
+
+# columns of the results table
+columns = ["env", "status", "arrived", "makespan", "actions", "optimal", "ground_time", "solve_time", "wall_time", "peak_rss_mb", "message"]
+
+
+def find_envs(pattern) -> list:
+    """
+    list the .pkl, .npz and .lp environments of a directory or glob pattern
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*")
+
+    return(sorted(f for f in glob.glob(pattern) if f.endswith((".pkl", ".npz", ".lp"))))
+
+
+def job_name(path) -> str:
+    """
+    name of the log and output folder of a job: its path with the separators replaced, including the extension
+    so that jobs with the same file name in other directories or formats do not overwrite each other
+    """
+    return(os.path.normpath(path).lstrip(os.sep).replace(os.sep, "_"))
+
+
+def solve_lp(path) -> dict:
+    """
+    solve an environment given as clingo facts with the primary encodings and the solver options of asp/params.py
+    without a Flatland object there is nothing to simulate, so only the initial plan is computed
+    """
+    # these need the Flatland object, which an .lp environment does not have
+    needs_env = {"prune": "reachable/4 facts", "successors": "succ/5 facts", "incremental": "the earliest arrivals", "portfolio": "racing"}
+    missing = [needed for param, needed in needs_env.items() if getattr(params, param, False)]
+    if missing:
+        return({"status": "skipped", "message": f"an .lp environment has no Flatland object for {' and '.join(missing)}"})
+
+    threads = getattr(params, 'threads', 1)
+    budget = getattr(params, 'budget', None)
+    ctl = clingo.Control(solver_options(threads, getattr(params, 'configuration', None), getattr(params, 'opt_strategy', None)))
+    ctl.configuration.solve.models="1"
+
+    start = time.perf_counter()
+    for f in params.primary:
+        load_encoding(ctl, f)
+    ctl.load(path)
+    ctl.ground([("base", [])])
+    ground_time = time.perf_counter() - start
+
+    # like FlatlandPlan, the budget covers grounding, and competing threads optimize
+    solve_start = time.perf_counter()
+    if budget is not None or threads > 1:
+        models, _, optimal = solve_anytime(ctl, None if budget is None else max(budget - ground_time, 0))
+    else:
+        models = []
+        with ctl.solve(yield_=True) as handle:
+            for model in handle:
+                models.append(model.symbols(shown=True))
+            optimal = bool(models) and handle.get().exhausted
+    solve_time = time.perf_counter() - solve_start
+
+    actions = build_action_list(models)
+    return({
+        "status": "solved" if models else "unsat",
+        "makespan": len(actions),
+        "actions": sum(len(step) for step in actions),
+        "optimal": optimal,
+        "ground_time": ground_time,
+        "solve_time": solve_time
+    })
+
+
+def solve_pkl(path, render, stamp) -> dict:
+    """
+    simulate a .pkl or .npz environment like solve.py, replanning after malfunctions
+    """
+    name = job_name(path)
+    env = load_env(path)
+    sim = build_manager(env)
+    log = OutputLogManager()
+
+    actions, done, states = simulate(env, sim, log)
+    if render:
+        # the jobs already run in parallel, so each one renders in its own process
+        os.makedirs(f"output/{stamp}/{name}", exist_ok=True)
+        with FrameWriter(f"output/{stamp}/{name}/animation.gif") as writer:
+            render_states(env, states, writer, workers=1)
+        log.save(f"{stamp}/{name}")
+
+    if not actions:
+        status = "unsat"
+    else:
+        status = "solved" if done else "incomplete"
+
+    # state 6 is done, see state_names in modules/trace.py
+    arrived = sum(int(agent.state) == 6 for agent in env.agents)
+
+    return({
+        "status": status,
+        "arrived": f"{arrived}/{len(env.agents)}",
+        "makespan": len(actions),
+        "actions": sum(len(step) for step in actions),
+        "optimal": sim.optimal,
+        "ground_time": sim.ground_time,
+        "solve_time": sim.solve_time
+    })
+
+
+def worker(path, render, stamp, conn) -> None:
+    """ solve one environment in a child process and send its results row """
+    # clingo prints to the file descriptors directly, so they are redirected to a log per job
+    name = job_name(path)
+    with open(f"output/{stamp}/{name}.log", "w") as f:
+        os.dup2(f.fileno(), 1)
+        os.dup2(f.fileno(), 2)
+
+    start = time.perf_counter()
+    try:
+        if path.endswith(".lp"):
+            row = solve_lp(path)
+        else:
+            row = solve_pkl(path, render, stamp)
+    except Exception as e:
+        traceback.print_exc()
+        row = {"status": "error", "message": f"{type(e).__name__}: {e}"}
+
+    # ru_maxrss is given in kilobytes on Linux
+    row["wall_time"] = time.perf_counter() - start
+    row["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    conn.send(row)
+    conn.close()
+
+
+def run_job(path, render, stamp, timeout) -> dict:
+    """
+    solve one environment in its own process, which is terminated after timeout seconds
+    """
+    # spawn, since forking a process with running threads is unsafe
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=worker, args=(path, render, stamp, sender))
+
+    start = time.perf_counter()
+    process.start()
+    sender.close()
+
+    row = {"status": "timeout"}
+    if receiver.poll(timeout):
+        try:
+            row = receiver.recv()
+        except EOFError:
+            # the process died without sending, e.g. killed for using too much memory
+            row = {"status": "error", "message": f"exit code {process.exitcode}"}
+
+    if process.is_alive():
+        process.terminate()
+    process.join()
+
+    row.setdefault("wall_time", time.perf_counter() - start)
+    row["env"] = path
+    return(row)
+
+
+def save_results(filename, rows) -> None:
+    """ save the results table as a csv file """
+    with open(filename, "w") as f:
+        f.write(";".join(columns) + "\n")
+        for row in rows:
+            values = []
+            for column in columns:
+                value = row.get(column, "")
+                values.append(f"{value:.3f}" if isinstance(value, float) else str(value))
+            f.write(";".join(values) + "\n")
+
+
+def get_args():
+    """ capture command line inputs """
+    parser = ArgumentParser()
+    parser.add_argument('envs', type=str, help='a directory or glob pattern of .pkl, .npz and .lp environments')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='the number of environments solved at the same time')
+    parser.add_argument('--timeout', type=float, default=600, help='the number of seconds after which a job is terminated')
+    parser.add_argument('--render', action='store_true', help='save an animation and output log for each .pkl and .npz environment')
+    return(parser.parse_args())
+
+
+def main():
+    if check_params(params):
+        args: Namespace = get_args()
+        envs = find_envs(args.envs)
+
+    if not envs:
+        raise ValueError(f"No .pkl, .npz or .lp environments found in '{args.envs}'")
+
+    stamp = time.time()
+    os.makedirs(f"output/{stamp}", exist_ok=True)
+
+    # each thread waits on one child process, so the number of threads bounds the number of processes
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        jobs = [pool.submit(run_job, env, args.render, stamp, args.timeout) for env in envs]
+        rows = []
+        for job in jobs:
+            row = job.result()
+            print(f"{row['env']}: {row['status']} ({row['wall_time']:.1f}s)", flush=True)
+            rows.append(row)
+
+    save_results(f"output/{stamp}/results.csv", rows)
+    print(f"results saved to output/{stamp}/results.csv")
+
+
+if __name__ == "__main__":
+    main()
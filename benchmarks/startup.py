@@ -0,0 +1,81 @@
+"""
+benchmark of the cold start of the command line tools
+
+every sample starts a fresh interpreter that only imports one module, and the median wall time
+is compared to a budget; a module also fails if importing it loads one of the heavy modules that
+only simulating, rendering or plotting needs
+
+    python benchmarks/startup.py --budget 0.5
+"""
+
+# standard packages
+import os
+import sys
+import time
+import statistics
+import subprocess
+from argparse import ArgumentParser, Namespace
+
+# the root of the repository, from where the tools are started
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that must not be loaded at startup
+heavy_modules = ["flatland.envs.rail_env", "flatland.utils.rendertools", "matplotlib", "pandas", "imageio", "networkx"]
+
+
+def startup_time(module, samples) -> tuple:
+    """
+    import the module in samples fresh interpreters
+    returns the median wall time in seconds and the heavy modules that were loaded
+    """
+    code = f"import sys, {module}; print(','.join(m for m in {heavy_modules!r} if m in sys.modules))"
+    env = dict(os.environ, PYTHONPATH=root)
+
+    times = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", code], cwd=root, env=env, capture_output=True, text=True)
+        times.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    loaded = [m for m in result.stdout.strip().split(",") if m]
+    return(statistics.median(times), loaded)
+
+
+def get_args():
+    """ capture command line inputs """
+    parser = ArgumentParser()
+    parser.add_argument('--modules', type=str, nargs='+', default=['solve', 'batch', 'build', 'catalog'], help='the modules whose startup is measured')
+    parser.add_argument('--samples', type=int, default=5, help='the number of interpreters started per module')
+    parser.add_argument('--budget', type=float, default=0.5, help='the maximum median startup time in seconds')
+    return(parser.parse_args())
+
+
+def main():
+    args: Namespace = get_args()
+
+    # the interpreter with numpy and clingo is the floor that no tool can go below
+    floor, _ = startup_time("numpy, clingo", args.samples)
+    print(f"{'numpy, clingo':<10} {floor:.3f}s (floor)")
+
+    failed = []
+    for module in args.modules:
+        seconds, loaded = startup_time(module, args.samples)
+        problems = []
+        if seconds > args.budget:
+            problems.append(f"over the budget of {args.budget:.3f}s")
+        if loaded:
+            problems.append(f"loads {', '.join(loaded)}")
+
+        print(f"{module:<10} {seconds:.3f}s {'; '.join(problems) if problems else 'ok'}")
+        if problems:
+            failed.append(module)
+
+    if failed:
+        print(f"startup regressed for {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
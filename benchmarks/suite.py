@@ -0,0 +1,326 @@
+"""
+benchmark and regression suite for the encodings
+
+every encoding set is grounded and solved on every instance it applies to, each run in its own
+process with a timeout; clingo's statistics (ground atoms and rules, choices, conflicts, the
+grounding and solving times and the optimal cost) are recorded with the wall time and the peak
+memory of the run, and saved as JSON
+
+instances are .lp files of facts, .npz environments and a ladder of generated environments of
+growing size, which are stored in tmp/bench so that they are built only once; encoding sets that
+need reachable/4 or succ/5 facts only apply to .npz and generated instances
+
+    python benchmarks/suite.py run --output benchmarks/baseline.json
+    python benchmarks/suite.py run --encodings flat --ladder 30x30:4
+    python benchmarks/suite.py compare output/bench/<stamp>.json --baseline benchmarks/baseline.json
+
+compare exits with 1 if a run got slower, bigger or worse than in the baseline
+"""
+
+# standard packages
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import traceback
+import multiprocessing
+from argparse import ArgumentParser, Namespace
+
+# the root of the repository, from where the encodings and instances are found
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+# clingo
+import clingo
+
+# encoding sets, their files and the facts they need besides the environment
+samples = "Samples/Update_2024_12-01/asp"
+encodings = {
+    "flat": {"files": ["asp/flat.lp", "asp/trans.lp"], "facts": []},
+    "flat_pruned": {"files": ["asp/flat_pruned.lp", "asp/trans.lp"], "facts": ["reach"]},
+    "flat_succ": {"files": ["asp/flat_succ.lp"], "facts": ["succ"]},
+    "compact": {"files": ["asp/compact.lp"], "facts": ["reach", "succ"]},
+    "graph_based": {"files": [f"{samples}/graph_based/graph.lp", f"{samples}/graph_based/actions.lp", f"{samples}/graph_based/traverse.lp"], "facts": []},
+    "action_based": {"files": [f"{samples}/action_based/pathfinding.lp", f"{samples}/action_based/actions.lp", f"{samples}/action_based/transitions.lp"], "facts": []},
+    "transition_based": {"files": [f"{samples}/transition_based/path.lp", f"{samples}/transition_based/subgraph.lp"], "facts": []},
+}
+
+default_instances = ["envs/assignment/env_01.lp", "envs/assignment/env_02.lp", "envs/assignment/env_03.lp", "envs/custom/env1.lp", "envs/custom/env2.lp"]
+
+# generated environments as WIDTHxHEIGHT:AGENTS
+default_ladder = ["25x25:2", "30x30:4", "40x40:8", "60x60:16"]
+
+# statistics of a run that grow with the ground program and should not change between machines
+size_keys = ["atoms", "rules"]
+time_keys = ["ground_time", "solve_time", "wall_time"]
+
+# statuses from best to worst
+statuses = ["optimal", "solved", "unsat", "timeout", "error"]
+
+
+def parse_size(size) -> tuple:
+    """ read WIDTHxHEIGHT:AGENTS as (width, height, agents) """
+    try:
+        grid, agents = size.split(":")
+        width, height = grid.split("x")
+        return(int(width), int(height), int(agents))
+    except ValueError:
+        raise ValueError(f"Size '{size}' should be given as WIDTHxHEIGHT:AGENTS, e.g. 30x30:4")
+
+
+def ladder_instance(size, seed, path="tmp/bench") -> str:
+    """ generate the environment of a size once and return the path of its .npz file """
+    from modules.pipeline import BuildConfig, build
+    from modules.envfile import save_env
+
+    width, height, agents = parse_size(size)
+    filename = os.path.join(path, f"ladder_{width}x{height}_{agents}_{seed}.npz")
+    if not os.path.exists(filename):
+        os.makedirs(path, exist_ok=True)
+        env, _ = build(BuildConfig(width=width, height=height, number_of_agents=agents, seed=seed))
+        save_env(filename, env)
+
+    return(filename)
+
+
+def applies(instance, encoding) -> bool:
+    """ whether the facts an encoding set needs can be computed for an instance """
+    return(instance.endswith(".npz") or not encodings[encoding]["facts"])
+
+
+def load_instance(ctl, instance, facts) -> None:
+    """ add the facts of an instance to the control """
+    if instance.endswith(".lp"):
+        ctl.load(instance)
+        return
+
+    from modules.envfile import load_env_data
+    from modules.convert import convert_to_clingo, convert_reach_to_clingo, convert_succ_to_clingo
+
+    data = load_env_data(instance)
+    ctl.add(convert_to_clingo(data))
+    if "reach" in facts:
+        ctl.add(convert_reach_to_clingo(data))
+    if "succ" in facts:
+        ctl.add(convert_succ_to_clingo(data))
+
+
+def run_encoding(instance, encoding, timeout) -> dict:
+    """ ground and solve an instance with an encoding set and read the statistics of clingo """
+    # warnings about undefined atoms would be printed for every run
+    ctl = clingo.Control(["--stats"], logger=lambda code, message: None)
+    ctl.configuration.solve.models = "0"
+
+    start = time.perf_counter()
+    load_instance(ctl, instance, encodings[encoding]["facts"])
+    for f in encodings[encoding]["files"]:
+        ctl.load(os.path.join(root, f))
+    ctl.ground([("base", [])])
+    ground_time = time.perf_counter() - start
+
+    # the rest of the timeout is left for solving, the best model so far counts when it runs out
+    start = time.perf_counter()
+    with ctl.solve(async_=True) as handle:
+        if not handle.wait(max(timeout - ground_time, 0)):
+            handle.cancel()
+        result = handle.get()
+    solve_time = time.perf_counter() - start
+
+    stats = ctl.statistics
+    models = stats["summary"]["models"]
+    if result.interrupted:
+        status = "timeout"
+    elif not result.satisfiable:
+        status = "unsat"
+    else:
+        status = "optimal" if models["optimal"] > 0 else "solved"
+
+    return({
+        "status": status,
+        "atoms": int(stats["problem"]["lp"]["atoms"]),
+        "rules": int(stats["problem"]["lp"]["rules"]),
+        "choices": int(stats["solving"]["solvers"]["choices"]),
+        "conflicts": int(stats["solving"]["solvers"]["conflicts"]),
+        "models": int(models["enumerated"]),
+        "cost": [int(c) for c in stats["summary"].get("costs", [])] if models["enumerated"] else None,
+        "ground_time": ground_time,
+        "solve_time": solve_time
+    })
+
+
+def worker(instance, encoding, timeout, conn) -> None:
+    """ benchmark one run in a child process and send its statistics """
+    start = time.perf_counter()
+    try:
+        row = run_encoding(instance, encoding, timeout)
+    except Exception as e:
+        traceback.print_exc()
+        row = {"status": "error", "message": f"{type(e).__name__}: {e}"}
+
+    # ru_maxrss is given in kilobytes on Linux
+    row["wall_time"] = time.perf_counter() - start
+    row["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    conn.send(row)
+    conn.close()
+
+
+def run_job(instance, encoding, timeout, grace=10) -> dict:
+    """
+    benchmark one run in its own process, so that its peak memory is its own
+    the process stops solving after timeout seconds and is terminated if grounding takes longer than that and grace
+    """
+    # spawn, so that no run inherits the memory of another
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=worker, args=(instance, encoding, timeout, sender))
+
+    start = time.perf_counter()
+    process.start()
+    sender.close()
+
+    row = {"status": "timeout"}
+    if receiver.poll(timeout + grace):
+        try:
+            row = receiver.recv()
+        except EOFError:
+            row = {"status": "error", "message": f"exit code {process.exitcode}"}
+
+    if process.is_alive():
+        process.terminate()
+    process.join()
+
+    row.setdefault("wall_time", time.perf_counter() - start)
+    return({"instance": instance, "encoding": encoding, **row})
+
+
+def run_suite(instances, encoding_names, timeout) -> list:
+    """ benchmark every encoding set on every instance it applies to """
+    runs = []
+    for instance in instances:
+        for encoding in encoding_names:
+            if not applies(instance, encoding):
+                continue
+            row = run_job(instance, encoding, timeout)
+            print(f"{instance:<40} {encoding:<18} {row['status']:<8} {row.get('atoms', '-'):>10} atoms {row['wall_time']:8.2f}s", flush=True)
+            runs.append(row)
+
+    return(runs)
+
+
+def compare_runs(runs, baseline, time_tolerance, size_tolerance, memory_tolerance, min_time) -> list:
+    """
+    compare the runs of a suite to those of a baseline
+    returns a list of (instance, encoding, problem) for every regression
+    """
+    before = {(run["instance"], run["encoding"]): run for run in baseline}
+    regressions = []
+    for run in runs:
+        key = (run["instance"], run["encoding"])
+        if key not in before:
+            print(f"{key[0]:<40} {key[1]:<18} not in baseline")
+            continue
+        old = before[key]
+
+        def flag(problem):
+            regressions.append((*key, problem))
+
+        if statuses.index(run["status"]) > statuses.index(old["status"]):
+            flag(f"status {old['status']} -> {run['status']}")
+        # sizes and costs are only comparable if both runs got that far
+        if "atoms" in run and "atoms" in old:
+            for name in size_keys:
+                if run[name] > old[name] * size_tolerance:
+                    flag(f"{name} {old[name]} -> {run[name]}")
+        if run.get("cost") and old.get("cost") and run["status"] == old["status"] == "optimal" and run["cost"] > old["cost"]:
+            flag(f"cost {old['cost']} -> {run['cost']}")
+
+        # short runs vary too much to compare their times
+        for name in time_keys:
+            if name in run and name in old and run[name] > old[name] * time_tolerance and run[name] - old[name] > min_time:
+                flag(f"{name} {old[name]:.3f}s -> {run[name]:.3f}s")
+        if "peak_rss_mb" in run and "peak_rss_mb" in old and run["peak_rss_mb"] > old["peak_rss_mb"] * memory_tolerance:
+            flag(f"peak_rss_mb {old['peak_rss_mb']:.1f} -> {run['peak_rss_mb']:.1f}")
+
+    for key in sorted(before.keys() - {(run["instance"], run["encoding"]) for run in runs}):
+        print(f"{key[0]:<40} {key[1]:<18} not run")
+
+    return(regressions)
+
+
+def load_results(filename) -> list:
+    """ load the runs of a results file """
+    with open(filename) as f:
+        return(json.load(f)["runs"])
+
+
+def save_results(filename, runs, timeout) -> None:
+    """ save the runs with the setup they were measured on """
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    results = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "clingo": clingo.__version__,
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "timeout": timeout,
+        "runs": runs
+    }
+    with open(filename, "w") as f:
+        json.dump(results, f, indent=1)
+
+
+def get_args():
+    """ capture command line inputs """
+    parser = ArgumentParser()
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='benchmark the encoding sets and save the results as JSON')
+    run.add_argument('--encodings', type=str, nargs='+', default=list(encodings), choices=list(encodings), help='the encoding sets to benchmark, all by default')
+    run.add_argument('--instances', type=str, nargs='*', default=default_instances, help='the .lp and .npz instances to benchmark on')
+    run.add_argument('--ladder', type=str, nargs='*', default=default_ladder, help=f'the sizes of generated instances as WIDTHxHEIGHT:AGENTS, {" ".join(default_ladder)} by default')
+    run.add_argument('--seed', type=int, default=1, help='the seed of the generated instances')
+    run.add_argument('--timeout', type=float, default=300, help='the seconds each run may ground and solve')
+    run.add_argument('--output', type=str, default=None, help='the results file, output/bench/<timestamp>.json by default')
+
+    compare = commands.add_parser('compare', help='compare results to a baseline and exit with 1 on regressions')
+    compare.add_argument('results', type=str, help='the results file to check')
+    compare.add_argument('--baseline', type=str, default='benchmarks/baseline.json', help='the results file to compare to')
+    compare.add_argument('--time-tolerance', type=float, default=1.5, help='the factor by which times may grow')
+    compare.add_argument('--size-tolerance', type=float, default=1.1, help='the factor by which ground atoms and rules may grow')
+    compare.add_argument('--memory-tolerance', type=float, default=1.25, help='the factor by which the peak memory may grow')
+    compare.add_argument('--min-time', type=float, default=0.5, help='the seconds by which a time must grow to count')
+    return(parser.parse_args())
+
+
+def main():
+    args: Namespace = get_args()
+
+    if args.command == 'run':
+        os.chdir(root)
+        instances = args.instances + [ladder_instance(size, args.seed) for size in args.ladder]
+        runs = run_suite(instances, args.encodings, args.timeout)
+
+        output = args.output or f"output/bench/{time.strftime('%Y%m%d-%H%M%S')}.json"
+        save_results(output, runs, args.timeout)
+        print(f"results saved to {output}")
+        return
+
+    # exit code 1 is kept for regressions
+    for filename in [args.results, args.baseline]:
+        if not os.path.exists(filename):
+            print(f"{filename} does not exist, record it with: python benchmarks/suite.py run --output {filename}", file=sys.stderr)
+            sys.exit(2)
+
+    regressions = compare_runs(load_results(args.results), load_results(args.baseline), args.time_tolerance, args.size_tolerance, args.memory_tolerance, args.min_time)
+    for instance, encoding, problem in regressions:
+        print(f"{instance:<40} {encoding:<18} {problem}")
+
+    if regressions:
+        print(f"{len(regressions)} regressions against {args.baseline}")
+        sys.exit(1)
+    print(f"no regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
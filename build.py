@@ -1,40 +1,35 @@
+import os
 from envs import params
 from argparse import ArgumentParser, Namespace
 
 # custom modules
-from modules.dirs import create_dirs, find_start
-from modules.save import save_lp, save_png, save_pkl
-from modules.convert import convert_to_clingo
-
-# Flatland modules
-from flatland.envs.rail_env import RailEnv
-from flatland.envs.rail_env import RailEnvActions # do we still need this?
-from flatland.envs.rail_generators import sparse_rail_generator
-from flatland.envs.line_generators import sparse_line_generator
-from flatland.envs.observations import GlobalObsForRailEnv
-from flatland.envs.malfunction_generators import MalfunctionParameters, ParamMalfunctionGen
+from modules.dirs import create_dirs
+from modules.catalog import Catalog
+from modules.generate import build_envs
+
+
+# parameters of envs/params.py and their types
+required_params = {
+    "width": int,
+    "height": int,
+    "number_of_agents": int,
+    "max_num_cities": int,
+    "seed": int,
+    "grid_mode": bool,
+    "max_rails_between_cities": int,
+    "max_rail_pairs_in_city": int,
+    "remove_agents_at_target": bool,
+    "speed_ratio_map": dict,
+    "malfunction_rate": float,
+    "min_duration": int,
+    "max_duration":  int
+}
 
 
 def check_params(par):
     """
     verify that all parameters exist before proceeding
     """
-    required_params = {
-        "width": int,
-        "height": int,
-        "number_of_agents": int,
-        "max_num_cities": int,
-        "seed": int,
-        "grid_mode": bool,
-        "max_rails_between_cities": int,
-        "max_rail_pairs_in_city": int,
-        "remove_agents_at_target": bool,
-        "speed_ratio_map": dict,
-        "malfunction_rate": float,
-        "min_duration": int,
-        "max_duration":  int
-    }
-
     # check that all required parameters exist and have the correct type
     for param, expected_type in required_params.items():
         if not hasattr(par, param):
@@ -59,53 +54,60 @@ def get_args():
     """
     parser = ArgumentParser()
     parser.add_argument('num_envs', type=int, default=1, nargs='?', help='the number of environments to create according to the given parameters')
+    parser.add_argument('--start', type=int, default=None, help='the index of the first environment, by default one after the highest index in the catalog')
+    parser.add_argument('--seed', type=int, default=None, help='the base seed from which the seed of every index is derived, by default the seed of params.py')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='the number of environments built at the same time')
+    parser.add_argument('--no-lp', dest='lp', action='store_false', help='do not save the .lp files')
+    parser.add_argument('--no-png', dest='png', action='store_false', help='do not save the .png files')
+    parser.add_argument('--no-pkl', dest='pkl', action='store_false', help='do not save the .pkl files')
+    parser.add_argument('--no-npz', dest='npz', action='store_false', help='do not save the .npz files')
 
     return(parser.parse_args())
 
 
+def build(num_envs, start=None, seed=None, workers=os.cpu_count(), lp=True, png=True, pkl=True, npz=True, pool=None):
+    """
+    build num_envs environments with the parameters of envs/params.py and add them to the catalog
+    yields the result of every environment as it finishes, with the name of the cataloged
+    environment of the same grid as 'duplicate' if its files were removed again
+    """
+    path = create_dirs()
+    with Catalog(path + 'catalog.db') as catalog:
+        # environments that were built before the catalog existed are added first
+        if catalog.next_number() == 1:
+            catalog.scan(path)
+        start_index = catalog.next_number() if start is None else start
+
+        # the parameters are passed to the processes as a dict, since modules cannot be pickled
+        par = {param: getattr(params, param) for param in required_params}
+        if seed is not None:
+            par["seed"] = seed
+
+        indices = range(start_index, start_index + num_envs)
+        for result in build_envs(par, indices, path, workers=min(workers, num_envs), lp=lp, png=png, pkl=pkl, npz=npz, pool=pool):
+            existing = catalog.add(result["entry"])
+            result["duplicate"] = None
+            if existing is not None:
+                # the same grid is already in the catalog, so the new files are removed again
+                for file_type in ["lp", "pkl", "png", "npz"]:
+                    if result["entry"][file_type] is not None:
+                        os.remove(result["entry"][file_type])
+                result["duplicate"] = existing["name"]
+            yield result
+
+
 def main():
     if check_params(params):
-        path = create_dirs()
-        start_index = find_start(path)
         args: Namespace = get_args()
 
-        for i in range(start_index, start_index + args.num_envs):
-            rail_generator = sparse_rail_generator(
-                        max_num_cities= params.max_num_cities,
-                        #seed= params.seed,
-                        grid_mode= params.grid_mode,
-                        max_rails_between_cities= params.max_rails_between_cities,
-                        max_rail_pairs_in_city= params.max_rail_pairs_in_city,
-                        )
-
-            stochastic_data = MalfunctionParameters(
-                        malfunction_rate= params.malfunction_rate,
-                        min_duration= params.min_duration,
-                        max_duration= params.max_duration
-                        )
-
-            speed_ratio_map = params.speed_ratio_map
-            line_generator = sparse_line_generator(speed_ratio_map)
-            observation_builder = GlobalObsForRailEnv()
-
-            env = RailEnv(
-                        width= params.width,
-                        height= params.height,
-                        rail_generator= rail_generator,
-                        line_generator= line_generator,
-                        number_of_agents= params.number_of_agents,
-                        obs_builder_object= observation_builder,
-                        malfunction_generator=ParamMalfunctionGen(stochastic_data),
-                        remove_agents_at_target= params.remove_agents_at_target
-                        )
-            env.reset()
-
-            # save files
-            file_name = f"env_{i:03d}--{params.number_of_agents}_{params.max_num_cities}"
-            save_lp(convert_to_clingo(env), file_name, path)
-            save_png(env, file_name, path)
-            save_pkl(env, file_name, path)
-            
+    for result in build(args.num_envs, args.start, args.seed, args.workers, args.lp, args.png, args.pkl, args.npz):
+        if result["duplicate"] is not None:
+            print(f"{result['file_name']} skipped, same grid as {result['duplicate']}", flush=True)
+            continue
+
+        retried = f", {result['attempts']} attempts" if result['attempts'] > 1 else ""
+        print(f"{result['file_name']} (seed {result['seed']}{retried})", flush=True)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,49 @@
+# standard packages
+from argparse import ArgumentParser, Namespace
+
+# custom modules
+from modules.catalog import Catalog, file_types
+
+
+def get_args():
+    """ capture command line inputs """
+    parser = ArgumentParser(description='list the environments of the catalog that match all given filters')
+    parser.add_argument('--catalog', type=str, default='envs/catalog.db', help='the catalog file, envs/catalog.db by default')
+    parser.add_argument('--scan', type=str, default=None, help='first add the environments saved in the lp/, pkl/, png/ and npz/ folders of this directory')
+    for column in ['agents', 'cities', 'width', 'height']:
+        parser.add_argument(f'--{column}', type=int, default=None, help=f'exact number of {column}')
+        parser.add_argument(f'--min-{column}', type=int, default=None, help=f'minimum number of {column}')
+        parser.add_argument(f'--max-{column}', type=int, default=None, help=f'maximum number of {column}')
+    parser.add_argument('--malfunction-rate', type=float, default=None, help='exact malfunction rate')
+    parser.add_argument('--max-malfunction-rate', type=float, default=None, help='maximum malfunction rate')
+    parser.add_argument('--order', type=str, default='number', help='the column to sort by')
+    parser.add_argument('--limit', type=int, default=None, help='the maximum number of environments to list')
+    parser.add_argument('--paths', type=str, default=None, choices=file_types, help='only print the paths of this file format, one per line')
+    return(parser.parse_args())
+
+
+def main():
+    args: Namespace = get_args()
+    filters = {key: value for key, value in vars(args).items() if key not in ['catalog', 'scan', 'order', 'limit', 'paths']}
+
+    with Catalog(args.catalog) as catalog:
+        if args.scan is not None:
+            added, duplicates = catalog.scan(args.scan)
+            print(f"added {added} environments, skipped {duplicates} with a grid that is already in the catalog")
+
+        entries = catalog.query(order=args.order, limit=args.limit, **filters)
+
+    if args.paths is not None:
+        for entry in entries:
+            if entry[args.paths] is not None:
+                print(entry[args.paths])
+        return
+
+    columns = ['name', 'width', 'height', 'agents', 'cities', 'seed', 'malfunction_rate']
+    print(";".join(columns))
+    for entry in entries:
+        print(";".join("" if entry[column] is None else str(entry[column]) for column in columns))
+
+
+if __name__ == "__main__":
+    main()
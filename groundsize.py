@@ -0,0 +1,126 @@
+# standard packages
+import sys
+from argparse import ArgumentParser, Namespace
+
+# custom modules
+from asp import params
+from envs import params as env_params
+from modules.envfile import EnvData, env_arrays, load_env, load_env_data
+from modules.groundsize import rule_columns, predicate_columns, env_symbols, file_symbols, profile_rules, growth
+from modules.spans import save_table
+
+
+def load_data(filename) -> EnvData:
+    """ load the arrays of a .npz or .pkl environment """
+    if filename.endswith(".npz"):
+        return(load_env_data(filename))
+    return(EnvData(env_arrays(load_env(filename))))
+
+
+def generate_data(agents) -> EnvData:
+    """ build the first environment of envs/params.py with another number of agents """
+    from modules.pipeline import BuildConfig, from_params, build
+
+    config = from_params(BuildConfig, env_params)
+    config.number_of_agents = agents
+    env, _ = build(config)
+    return(EnvData(env_arrays(env)))
+
+
+def scale_horizon(data, factor) -> EnvData:
+    """ stretch the time between the earliest departure and the latest arrival of every agent """
+    latest = data.earliest_departure + ((data.latest_arrival - data.earliest_departure) * factor).round().astype(data.latest_arrival.dtype)
+    return(EnvData({**data.arrays, "latest_arrival": latest}))
+
+
+def instances(args) -> list:
+    """ the (label, facts) of every point of the profile """
+    if args.env is not None and args.env.endswith(".lp"):
+        if args.agents or args.horizon:
+            raise ValueError("An .lp environment cannot be scaled, use a .npz or .pkl environment")
+        return([(args.env, file_symbols(args.env))])
+
+    prune, successors = getattr(params, 'prune', False), getattr(params, 'successors', False)
+    if args.agents:
+        envs = [(f"{agents} agents", generate_data(agents)) for agents in args.agents]
+    else:
+        envs = [(args.env, load_data(args.env))]
+
+    if args.horizon:
+        label, data = envs[0]
+        envs = [(f"horizon x{factor:g}", scale_horizon(data, factor)) for factor in args.horizon]
+
+    return([(label, env_symbols(data, prune, successors)) for label, data in envs])
+
+
+def print_table(rows, columns, limit) -> None:
+    """ print the largest rows of a table """
+    widths = {column: max([len(column)] + [len(str(row[column])[:80]) for row in rows[:limit]]) for column in columns}
+    # the source of a rule is cut, the csv file has it in full
+    print("  ".join(column.ljust(widths[column]) if column in ["location", "source", "predicate"] else column.rjust(widths[column]) for column in columns))
+    for row in rows[:limit]:
+        row = {**row, "source": str(row.get("source", ""))[:80]}
+        print("  ".join(str(row[column]).ljust(widths[column]) if column in ["location", "source", "predicate"] else str(row[column]).rjust(widths[column]) for column in columns))
+
+
+def get_args():
+    """ capture command line inputs """
+    parser = ArgumentParser(description='attribute the ground program of the encodings of asp/params.py to their rules and predicates')
+    parser.add_argument('env', type=str, default=None, nargs='?', help='the environment as a .npz, .pkl or .lp file')
+    parser.add_argument('--encodings', type=str, nargs='+', default=params.primary, help='the encodings, the primary encodings of asp/params.py by default')
+    parser.add_argument('--agents', type=int, nargs='+', default=None, help='instead of an environment, build the environment of envs/params.py with each of these numbers of agents')
+    parser.add_argument('--horizon', type=float, nargs='+', default=None, help='scale the time between earliest departure and latest arrival of the environment by each of these factors')
+    parser.add_argument('--by', type=str, default='rule', choices=['rule', 'predicate'], help='attribute the ground program to the rules of the encodings or to the predicates of the heads')
+    parser.add_argument('--limit', type=int, default=20, help='the number of rows to print')
+    parser.add_argument('--csv', type=str, default=None, help='also save the full table as a csv file')
+    args = parser.parse_args()
+    if args.env is None and not args.agents:
+        parser.error('an environment or --agents is required')
+    if args.env is not None and args.agents:
+        parser.error('an environment cannot be combined with --agents')
+    if args.agents and args.horizon:
+        parser.error('--agents cannot be combined with --horizon, scale one of them at a time')
+    return(args)
+
+
+def main():
+    args: Namespace = get_args()
+    key, columns = ("rule", rule_columns) if args.by == "rule" else ("predicate", predicate_columns)
+
+    points = []
+    for label, facts in instances(args):
+        rules, predicates, minimize = profile_rules(facts, args.encodings)
+        rows = rules if args.by == "rule" else predicates
+        total = sum(row["rules"] for row in rows)
+        print(f"{label}: {total} ground rules, {len(facts)} input facts, {sum(minimize.values())} minimize literals", file=sys.stderr)
+        points.append((label, rows))
+
+    if len(points) == 1:
+        rows = points[0][1]
+    else:
+        # one column of ground rules per point, and how fast they grow with the agents or the horizon
+        scales = args.agents or args.horizon
+        labels = [label for label, _ in points]
+        table = {}
+        for (label, point), scale in zip(points, scales):
+            for row in point:
+                entry = table.setdefault((row[key], row.get("source")), {column: row[column] for column in columns if column not in ["rules", "atoms", "body", "facts"]})
+                entry[label] = row["rules"]
+                entry.setdefault("points", []).append((scale, row["rules"]))
+
+        rows = []
+        for entry in table.values():
+            exponent = growth(entry.pop("points"))
+            entry["growth"] = "-" if exponent is None else f"{exponent:.2f}"
+            rows.append({**{label: 0 for label in labels}, **entry})
+
+        columns = [column for column in columns if column not in ["rules", "atoms", "body", "facts", "location", "source"]] + labels + ["growth"] + [column for column in ["location", "source"] if column in columns]
+        rows.sort(key=lambda row: row[labels[-1]], reverse=True)
+
+    print_table(rows, columns, args.limit)
+    if args.csv is not None:
+        save_table(args.csv, columns, rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import subprocess
 import shutil
-import time
+
+from modules import client
+from modules import pipeline
 
 
 def modify_build_paras(
@@ -20,7 +22,9 @@ def modify_build_paras(
 ):
     """Set the parameters for the environment creation.
 
-    This modifies the parameters in the envs/params.py file.
+    This modifies the parameters in the envs/params.py file. To build without
+    changing the file, e.g. in parallel experiments, pass a BuildConfig to
+    modules/pipeline.py instead.
 
     Args:
             width: width of the environment, number of columns (Y-Dimension)
@@ -86,34 +90,28 @@ def build_env(amount=None):
     The env is saved in the 'envs' folder.
     The lp file in envs/lp
     The pickle file in envs/pkl
+    The array file in envs/npz
     The png file in envs/png
 
     Args:
             amount: amount of environments to be created
     """
     if amount is not None:
-        # this line can randomly throw an OverflowError.
-        # subprocess.run(['python', 'build.py', str(amount)])
-
-        # this block is temporary until build.py error issue is fixed
-        retries = 0
-        max_retries = 10
-        while retries < max_retries:
-            try:
-                subprocess.run(
-                    ['python', 'build.py', str(amount)],
-                    capture_output=True, text=True, check=True
-                )
-                print(f'build.py successfully executed with {retries} retries.')
-                return
-            except subprocess.CalledProcessError as e:
-                if ("OverflowError: Python integer" in e.stderr and
-                        "out of bounds for uint16" in e.stderr):
-                    retries += 1
-                else:
-                    raise RuntimeError(f"Subprocess failed with error: {e.stderr}")
-        raise RuntimeError("Maximum retries for build.py exceeded without success.")
-        # end of temporary block
+        # a running service.py builds without starting a new interpreter
+        if client.available():
+            result = client.build(amount, progress=lambda event: print(event['file_name'], flush=True))
+            print(f"built {len(result['names'])} environments with service.py.")
+            return
+
+        # build.py retries a failing environment itself, with the next seed of its index
+        result = subprocess.run(
+            ['python', 'build.py', str(amount)],
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Subprocess failed with error: {result.stderr}")
+        print('build.py successfully executed.')
+        return
     else:
         print('No environment amount provided!')
         exit()
@@ -125,7 +123,9 @@ def modify_asp_params(primary=None, secondary=None):
 
     Specify the paths to ASP files that the solve function is supposed to use
     to generate an answer.
-    This modifies the primary and secondary list in the asp/params.py file.
+    This modifies the primary and secondary list in the asp/params.py file. To
+    solve without changing the file, pass a SolveConfig to modules/pipeline.py
+    instead.
 
     Example:
         modify_asp_params(
@@ -169,6 +169,11 @@ def solve(env_path=None):
                 solver on.
     """
     if env_path is not None:
+        # a running service.py solves without starting a new interpreter
+        if client.available():
+            result = client.solve([env_path])
+            print(f"{env_path}: {result['rows'][0]['status']}, saved to {result['output']}")
+            return
         subprocess.run(['python', 'solve.py', env_path])
     else:
         print('No environment path provided!')
@@ -176,6 +181,35 @@ def solve(env_path=None):
     return
 
 
+def solve_batch(envs=None, workers=None, timeout=None, render=False):
+    """Call the batch.py file with the given directory of environments.
+
+    Solve every .pkl, .npz and .lp environment of a directory or glob pattern in
+    parallel, and save a table of the results in the output folder.
+
+    Args:
+            envs: directory or glob pattern of the environments to solve.
+            workers: number of environments solved at the same time,
+                defaults to the number of cores.
+            timeout: number of seconds after which a single environment is
+                given up.
+            render: save an animation of each .pkl and .npz environment (True/False)
+    """
+    if envs is not None:
+        command = ['python', 'batch.py', envs]
+        if workers is not None:
+            command += ['--workers', str(workers)]
+        if timeout is not None:
+            command += ['--timeout', str(timeout)]
+        if render:
+            command.append('--render')
+        subprocess.run(command)
+    else:
+        print('No environment directory provided!')
+        exit()
+    return
+
+
 def reset_params():
     """Reset asp and envs parameters to original values.
 
@@ -189,21 +223,13 @@ def reset_params():
 
 
 if __name__ == "__main__":
-    # TODO: find way to get the name of the created env and give it to solve
-
-    # Building stage
-    modify_build_paras(
-        width=40, height=40, number_of_agents=4, max_num_cities=2, seed=1,
-        grid_mode=False, max_rails_between_cities=2, max_rail_pairs_in_city=2
+    # build and solve in one process, configured without rewriting the params files
+    result = pipeline.run(
+        pipeline.BuildConfig(
+            width=40, height=40, number_of_agents=4, max_num_cities=2, seed=1,
+            grid_mode=False, max_rails_between_cities=2, max_rail_pairs_in_city=2
+        ),
+        pipeline.SolveConfig(primary=['asp/flat.lp', 'asp/trans.lp'])
     )
-    build_env(amount=1)
-
-    # wait for envs to be saved
-    time.sleep(5)
-
-    # Solving Stage
-    modify_asp_params(primary=['asp/flat.lp', 'asp/trans.lp'])
-    solve(env_path='envs/pkl/env_001--4_2.pkl')
-
-    # reset parameters
-    # reset_params()
+    print(f'{result.arrived}/{len(result.env.agents)} trains arrived after '
+          f'{len(result.actions)} steps (seed {result.seed}).')
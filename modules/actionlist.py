@@ -1,6 +1,4 @@
-from flatland.envs.rail_env import RailEnv
-from flatland.envs.rail_env import RailEnvActions
-from flatland.utils.rendertools import RenderTool, AgentRenderVariant
+from flatland.envs.rail_env_action import RailEnvActions
 from modules.convert import convert_actions_to_flatland
 
 def to_dicts(action_list):
@@ -32,7 +30,11 @@ def to_dicts(action_list):
 def build_action_list(models):
     """
     given a model from clingo, build an python action list
+    without a model (unsatisfiable program), the list is empty
     """
+    if not models:
+        return([])
+
     action_list = []
     for func in models[0]: # only the first model
         func_name = func.name
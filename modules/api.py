@@ -1,49 +1,335 @@
+import os
 import sys
 import pickle
 import io
-from clingo.symbol import Number
+import time
+import clingo
+from clingo import ast
+from clingo.symbol import Function, Number
 from clingo.application import Application, clingo_main
-from modules.convert import convert_to_clingo
+from modules.convert import convert_to_clingo, convert_reach_to_clingo, convert_succ_to_clingo
+from modules.inject import env_to_symbols, reach_to_symbols, succ_to_symbols, add_facts, add_required
+from modules.reach import reachability
+from modules.cache import ground_key
 from modules.actionlist import build_action_list
+from modules.spans import span, record_solve
+
+
+# statements of the encodings parsed so far with their modification times, by path, once keep_parsed is called
+parsed = None
+
+
+def keep_parsed() -> None:
+    """ parse every encoding only once per process from now on, for workers that solve many environments """
+    global parsed
+    parsed = {}
+
+
+def load_encoding(ctl, filename) -> None:
+    """ load an encoding into the control, from its parsed statements after keep_parsed, unless the file changed """
+    if parsed is None:
+        ctl.load(filename)
+        return
+
+    path = os.path.abspath(filename)
+    mtime = os.stat(path).st_mtime_ns
+    if path not in parsed or parsed[path][0] != mtime:
+        statements = []
+        ast.parse_files([path], statements.append)
+        parsed[path] = (mtime, statements)
+
+    with ast.ProgramBuilder(ctl) as builder:
+        for statement in parsed[path][1]:
+            builder.add(statement)
+
+
+def solve_anytime(ctl, budget, assumptions=()) -> tuple:
+    """
+    optimize for at most budget seconds and keep the best model found so far
+    if no model has been found when the budget runs out, the search goes on until the first one
+    without a budget (None), the search goes on until the best model is proven optimal
+    returns a list with the best model's symbols (empty if unsatisfiable), its cost, and whether it is proven optimal
+    """
+    best = []
+    cost = []
+
+    def on_model(model):
+        nonlocal cost
+        best[:] = [model.symbols(atoms=True, shown=True)]
+        cost = model.cost
+        # without a #minimize statement, the first model is as good as any other
+        return(bool(model.cost))
+
+    # 0 models means all of them, in optimization mode only the improving ones are reported
+    models = ctl.configuration.solve.models
+    ctl.configuration.solve.models = "0"
+    with ctl.solve(assumptions=list(assumptions), on_model=on_model, async_=True) as handle:
+        finished = handle.wait(budget)
+        while not finished and not best:
+            finished = handle.wait(0.1)
+        if not finished:
+            handle.cancel()
+        # the search stops at the first model of a program without #minimize statements
+        optimal = bool(best) and (handle.get().exhausted or not cost)
+    ctl.configuration.solve.models = models
+
+    return(best, cost, optimal)
+
 
 class FlatlandPlan(Application):
-    """ takes an environment and a set of primary encodings """
+    """
+    takes an environment and a set of primary encodings
+    with inject=True, facts are written through the backend and actions is a (facts, required) tuple of symbols
+    with prune=True, the reachable/4 and earliest_arrival/2 facts of modules/reach.py are added (for asp/flat_pruned.lp)
+    with successors=True, the trans/4 and succ/5 facts of modules/transitions.py are added (for asp/flat_succ.lp)
+    with incremental=True, the encodings are grounded one timestep at a time (for asp/flat_inc.lp)
+    and actions is a (facts, required) tuple of symbols as well
+    with a cache (modules/cache.GroundCache), initial plans reuse ground programs of earlier runs
+    with a budget in seconds, the plan is optimized until the budget runs out and the best plan so far is kept
+    with optimize=True and no budget, the plan is optimized until it is proven optimal, as racing and threads need
+    """
     program_name = "flatland"
     version = "1.0"
 
-    def __init__(self, env, actions):
+    def __init__(self, env, actions, inject=False, prune=False, successors=False, incremental=False, cache=None, budget=None, optimize=False):
         self.env = env
         self.actions = actions
+        self.inject = inject
+        self.prune = prune
+        self.successors = successors
+        self.incremental = incremental
+        self.cache = cache
+        self.budget = budget
+        self.optimize = optimize
+        self.deadline = None
         self.action_list = None
 
+        # seconds spent solving, and everything else (adding facts, loading and grounding)
+        self.ground_time = 0
+        self.solve_time = 0
+
+        # cost of the returned model, and whether it is proven optimal
+        self.cost = []
+        self.optimal = False
+
+        # context is given as symbols for the backend
+        self.symbolic = inject or incremental
+
     def main(self, ctl, files):
-        # add encodings
-        for f in files: 
-            ctl.load(f)
         if not files:
             raise Exception('No file loaded into clingo.')
+
+        start = time.perf_counter()
+        self.deadline = None if self.budget is None else start + self.budget
+        ctl.configuration.solve.models="1"
+
+        if self.incremental:
+            self.add_program(ctl, files, self.inject)
+            models = self.solve_incremental(ctl)
+        elif self.cache is not None and self.actions is None:
+            self.ground_cached(ctl, files)
+            models = self.solve(ctl)
+        else:
+            self.add_program(ctl, files, self.inject)
+
+            # ground the program, then require the given actions
+            with span("ground"):
+                ctl.ground([("base", [])], context=self)
+            if self.symbolic and self.actions is not None:
+                add_required(ctl, self.actions[1])
+            models = self.solve(ctl)
+
+        # capture output actions for renderer
+        #return(build_action_list(models))
+        self.action_list = build_action_list(models)
+        self.ground_time = time.perf_counter() - start - self.solve_time
+        record_solve("plan" if self.actions is None else "replan", ctl, self.ground_time, self.solve_time)
+
+    def add_program(self, ctl, files, inject) -> None:
+        """ add the environment, the encodings and the context to the control """
+        if inject:
+            # add env facts without the parser
+            # (before loading the encodings, else clingo reports their signatures as missing)
+            with span("facts"):
+                add_facts(ctl, env_to_symbols(self.env))
+                if self.prune:
+                    add_facts(ctl, reach_to_symbols(self.env))
+                if self.successors:
+                    add_facts(ctl, succ_to_symbols(self.env))
+        if self.symbolic and self.actions is not None:
+            with span("context"):
+                add_facts(ctl, self.actions[0])
+
+        # add encodings
+        with span("load"):
+            for f in files: 
+                load_encoding(ctl, f)
         
-        # add env
-        ctl.add(convert_to_clingo(self.env))
-        
+        if not inject:
+            # add env
+            with span("facts"):
+                ctl.add(convert_to_clingo(self.env, empty_cells=False))
+                if self.prune:
+                    ctl.add(convert_reach_to_clingo(self.env))
+                if self.successors:
+                    ctl.add(convert_succ_to_clingo(self.env))
+
         # add actions
-        if self.actions is not None:
+        if not self.symbolic and self.actions is not None:
             print(f".join(self.actions): {' '.join(self.actions)}")
-            ctl.add('base', [], ' '.join(self.actions))
-        
-        # ground the program
-        ctl.ground([("base", [])], context=self)
-        ctl.configuration.solve.models="1"
+            with span("context"):
+                ctl.add('base', [], ' '.join(self.actions))
+
+    def ground_cached(self, ctl, files) -> None:
+        """
+        load the ground program from the cache, or ground it and store it
+        misses are grounded from text, since facts written through the backend would be recorded as shown atoms
+        """
+        key = ground_key(files, self.env, ("flatland", self.prune, self.successors))
+        with span("cache load"):
+            if self.cache.load(ctl, key):
+                return
+
+        writer = self.cache.record(ctl)
+        self.add_program(ctl, files, False)
+        with span("ground"):
+            ctl.ground([("base", [])], context=self)
+        with span("cache store"):
+            self.cache.store(key, writer)
+
+    def solve(self, ctl) -> list:
+        """ solve the grounded program and save models """
+        start = time.perf_counter()
+        if self.deadline is not None or self.optimize:
+            # the budget covers grounding as well, and all horizons of incremental mode
+            budget = None if self.deadline is None else max(self.deadline - start, 0)
+            with span("solve", budget=budget):
+                models, self.cost, self.optimal = solve_anytime(ctl, budget)
+            self.solve_time += time.perf_counter() - start
+            return(models)
 
-        # solve and save models
         models = []
-        with ctl.solve(yield_=True) as handle:
+        with span("solve"), ctl.solve(yield_=True) as handle:
             for model in handle:
-                models.append(model.symbols(atoms=True))
+                # programs loaded from the cache only know their shown atoms
+                models.append(model.symbols(atoms=True, shown=True))
+                self.cost = model.cost
 
-        # capture output actions for renderer
-        #return(build_action_list(models))
-        self.action_list = build_action_list(models)
+            # the search is only exhausted once no better model exists
+            self.optimal = bool(models) and handle.get().exhausted
+
+        self.solve_time += time.perf_counter() - start
+        return(models)
+
+    def solve_incremental(self, ctl) -> list:
+        """
+        ground and solve one timestep at a time until all trains can arrive
+        starts at the earliest arrival of the slowest train and stops at the latest arrival
+        """
+        pending = list(self.actions[1]) if self.actions is not None else []
+        arrivals = [arrival for _, _, _, arrival in reachability(self.env)]
+        upper = max(agent.latest_arrival for agent in self.env.agents)
+
+        # required actions at T need the positions at T+1
+        horizon = upper if None in arrivals else max(arrivals)
+        horizon = max([horizon, 1] + [s.arguments[2].number+1 for s in pending])
+
+        with span("ground"):
+            ctl.ground([("base", [])], context=self)
+        step = 0
+        while True:
+            parts = [("step", [Number(t)]) for t in range(step+1, horizon+1)]
+            parts.append(("check", [Number(horizon)]))
+            with span("ground", horizon=horizon):
+                ctl.ground(parts, context=self)
+            step = horizon
+
+            # require the given actions once their timestep is grounded
+            add_required(ctl, [s for s in pending if s.arguments[2].number < step])
+            pending = [s for s in pending if s.arguments[2].number >= step]
+
+            query = Function("query", [Number(horizon)])
+            ctl.assign_external(query, True)
+            models = self.solve(ctl)
+            if models or horizon >= upper:
+                return(models)
+
+            ctl.release_external(query)
+            horizon += 1
+
+
+
+
+class FlatlandSession():
+    """
+    keeps one clingo control alive for a whole simulation
+    the environment and encodings are grounded once, later plans only call solve()
+    executed actions and malfunction waits are passed as assumptions instead of constraints
+    with optimize=True, plans without a budget are optimized until they are proven optimal
+    """
+
+    def __init__(self, env, files, prune=False, successors=False, options=(), optimize=False):
+        if not files:
+            raise Exception('No file loaded into clingo.')
+
+        # options are clingo command line options, e.g. from modules/portfolio.solver_options
+        start = time.perf_counter()
+        self.ctl = clingo.Control(list(options))
+        with span("facts"):
+            add_facts(self.ctl, env_to_symbols(env))
+            if prune:
+                add_facts(self.ctl, reach_to_symbols(env))
+            if successors:
+                add_facts(self.ctl, succ_to_symbols(env))
+        with span("load"):
+            for f in files:
+                load_encoding(self.ctl, f)
+
+        # ground the program once
+        with span("ground"):
+            self.ctl.ground([("base", [])])
+        self.ctl.configuration.solve.models="1"
+        self.optimize = optimize
+
+        # seconds spent grounding, and solving over all plans
+        self.ground_time = time.perf_counter() - start
+        self.solve_time = 0
+
+        # cost of the last plan, and whether it is proven optimal
+        self.cost = []
+        self.optimal = False
+
+    def assumptions(self, required) -> list:
+        """
+        look up the literals of the required atoms
+        atoms that were never grounded get a fresh literal, which is false and makes the plan unsatisfiable
+        """
+        with self.ctl.backend() as backend:
+            return([backend.add_atom(symbol) for symbol in required])
+
+    def solve(self, required=(), budget=None) -> list:
+        """
+        solve under the given required action symbols and return the list of actions
+        with a budget in seconds, the plan is optimized until the budget runs out
+        """
+        start = time.perf_counter()
+        if budget is not None or self.optimize:
+            with span("solve", budget=budget):
+                models, self.cost, self.optimal = solve_anytime(self.ctl, budget, self.assumptions(required))
+        else:
+            models = []
+            with span("solve"), self.ctl.solve(assumptions=self.assumptions(required), yield_=True) as handle:
+                for model in handle:
+                    models.append(model.symbols(atoms=True))
+                    self.cost = model.cost
+
+                self.optimal = bool(models) and handle.get().exhausted
+
+        solve_time = time.perf_counter() - start
+        self.solve_time += solve_time
+        # the statistics of the control are those of its last solve, only the first one includes grounding
+        record_solve("replan" if required else "plan", self.ctl, 0 if required else self.ground_time, solve_time)
+        return(build_action_list(models))
 
 
 
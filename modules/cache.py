@@ -0,0 +1,171 @@
+"""
+custom functions for caching ground programs on disk
+
+a ground program is recorded with clingo's ground program observer, written in clingo's
+aspif format, and loaded straight into a new control on the next run with the same
+environment and encodings
+"""
+
+import os
+import hashlib
+
+import clingo
+import numpy as np
+
+# aspif codes of clingo's truth values for externals
+truth_codes = {"Free": 0, "True_": 1, "False_": 2, "Release": 3}
+
+
+class AspifWriter():
+    """ ground program observer that records the program as aspif statements """
+
+    def __init__(self):
+        self.lines = []
+
+    def add(self, *parts) -> None:
+        """ add one statement made of numbers, lists of numbers and strings """
+        tokens = []
+        for part in parts:
+            if isinstance(part, (list, tuple)):
+                tokens.extend(map(str, part))
+            else:
+                tokens.append(str(part))
+        self.lines.append(" ".join(tokens))
+
+    def rule(self, choice, head, body):
+        self.add(1, int(choice), len(head), head, 0, len(body), body)
+
+    def weight_rule(self, choice, head, lower_bound, body):
+        weighted = [value for pair in body for value in pair]
+        self.add(1, int(choice), len(head), head, 1, lower_bound, len(body), weighted)
+
+    def minimize(self, priority, literals):
+        weighted = [value for pair in literals for value in pair]
+        self.add(2, priority, len(literals), weighted)
+
+    def output_atom(self, symbol, atom):
+        # atom 0 marks a fact
+        name = str(symbol)
+        condition = [] if atom == 0 else [atom]
+        self.add(4, len(name), name, len(condition), condition)
+
+    def output_term(self, symbol, condition):
+        name = str(symbol)
+        self.add(4, len(name), name, len(condition), condition)
+
+    def external(self, atom, value):
+        self.add(5, atom, truth_codes[value.name])
+
+    def assume(self, literals):
+        self.add(6, len(literals), literals)
+
+    def program(self) -> str:
+        """ the recorded program as an aspif file """
+        return("asp 1 0 0\n" + "".join(line + "\n" for line in self.lines) + "0\n")
+
+
+def ground_key(files, env=None, options=()) -> str:
+    """
+    hash the encoding contents, the environment's rail grid and agent table, and extra options
+    """
+    digest = hashlib.sha256(clingo.__version__.encode())
+    for f in files:
+        with open(f, "rb") as encoding:
+            digest.update(encoding.read())
+
+    if env is not None:
+        grid = np.ascontiguousarray(env.rail.grid)
+        digest.update(f"{grid.shape}{grid.dtype}".encode())
+        digest.update(grid.tobytes())
+        for agent_info in env.agents:
+            digest.update(f"{agent_info.initial_position}{agent_info.initial_direction}{agent_info.target}{agent_info.earliest_departure}{agent_info.latest_arrival}".encode())
+
+    digest.update(repr(tuple(options)).encode())
+    return(digest.hexdigest())
+
+
+class GroundCache():
+    """
+    directory of aspif files named by their ground key
+    least recently used files are removed once the directory exceeds max_size bytes
+    """
+
+    def __init__(self, directory="tmp/ground", max_size=512*1024**2):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key) -> str:
+        return(os.path.join(self.directory, f"{key}.aspif"))
+
+    def load(self, ctl, key) -> bool:
+        """ load a cached ground program into the control, returns False on a miss """
+        path = self.path(key)
+        # load through a private hard link, which stays readable when another process evicts the program
+        private = f"{path}.load.{os.getpid()}"
+        if os.path.exists(private):
+            # left behind by a crashed process with the same id
+            os.remove(private)
+        try:
+            os.link(path, private)
+        except FileNotFoundError:
+            # never stored, or evicted by another process
+            return(False)
+
+        try:
+            os.utime(private)
+            ctl.load(private)
+        finally:
+            os.remove(private)
+        ctl.ground([("base", [])])
+        return(True)
+
+    def record(self, ctl) -> AspifWriter:
+        """ observe everything that is grounded into the control from now on """
+        writer = AspifWriter()
+        ctl.register_observer(writer)
+        return(writer)
+
+    def store(self, key, writer) -> None:
+        """ save a recorded program and evict old entries, programs larger than the cache are not saved """
+        program = writer.program()
+        if len(program) > self.max_size:
+            return
+
+        # write to a temporary file first, so that other processes never load a partial program
+        path = self.path(key)
+        temporary = f"{path}.{os.getpid()}"
+        with open(temporary, "w") as f:
+            f.write(program)
+        os.replace(temporary, path)
+        self.evict(keep=path)
+
+    def evict(self, keep=None) -> None:
+        """
+        remove least recently used programs until the cache fits into max_size, except for the program keep
+        other processes (racers, batch jobs) share the directory, so a program may vanish at any time and is then skipped
+        """
+        # one stat per program, so that its time and size stay consistent
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".aspif"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            total -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,183 @@
+"""
+custom functions for the catalog of built environments
+
+every environment is one row of an SQLite table with its size, agent and city counts, seed,
+malfunction parameters, a hash of its rail grid and the paths of its files; environments whose
+grid is already in the catalog are rejected, so that no grid is evaluated twice
+"""
+
+import os
+import re
+import pickle
+import sqlite3
+import hashlib
+
+from modules.envfile import EnvData, env_arrays, load_env_data
+
+# columns of the catalog and their SQLite types
+catalog_columns = {
+    "number": "INTEGER",
+    "name": "TEXT",
+    "width": "INTEGER",
+    "height": "INTEGER",
+    "agents": "INTEGER",
+    "cities": "INTEGER",
+    "seed": "INTEGER",
+    "malfunction_rate": "REAL",
+    "min_duration": "INTEGER",
+    "max_duration": "INTEGER",
+    "grid_hash": "TEXT",
+    "lp": "TEXT",
+    "pkl": "TEXT",
+    "png": "TEXT",
+    "npz": "TEXT"
+}
+
+# file formats of an environment, each one saved in the folder of the same name
+file_types = ["lp", "pkl", "png", "npz"]
+
+
+def grid_hash(grid) -> str:
+    """ hash the shape and contents of a rail grid """
+    digest = hashlib.sha256(f"{grid.shape}".encode())
+    digest.update(grid.astype("uint16").tobytes())
+    return(digest.hexdigest())
+
+
+def env_entry(data, name, number=None, cities=None, seed=None, files=None) -> dict:
+    """ describe the arrays of an EnvData as a catalog row """
+    rate, min_duration, max_duration = data.malfunction.tolist()
+    entry = {
+        "number": number,
+        "name": name,
+        "width": data.width,
+        "height": data.height,
+        "agents": len(data.direction),
+        "cities": cities,
+        "seed": seed,
+        "malfunction_rate": rate,
+        "min_duration": int(min_duration),
+        "max_duration": int(max_duration),
+        "grid_hash": grid_hash(data.grid)
+    }
+    for file_type in file_types:
+        entry[file_type] = (files or {}).get(file_type)
+
+    return(entry)
+
+
+class Catalog():
+    """
+    SQLite catalog of the environments of a directory
+    query() filters on any column, with min_ and max_ prefixes for ranges
+    """
+
+    def __init__(self, filename="envs/catalog.db"):
+        self.connection = sqlite3.connect(filename)
+        self.connection.row_factory = sqlite3.Row
+        columns = ", ".join(f"{name} {kind}" for name, kind in catalog_columns.items())
+        with self.connection:
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS envs ({columns}, UNIQUE (name), UNIQUE (grid_hash))")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS envs_size ON envs (agents, width, height)")
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *args):
+        self.close()
+
+    def find(self, grid_hash) -> dict:
+        """ the entry with the given grid hash, or None """
+        row = self.connection.execute("SELECT * FROM envs WHERE grid_hash = ?", (grid_hash,)).fetchone()
+        return(None if row is None else dict(row))
+
+    def add(self, entry) -> dict:
+        """
+        add an entry unless its grid is already in the catalog under another name
+        an entry of the same name is replaced, e.g. when an environment is built again
+        returns None if it was added, otherwise the entry of the existing environment
+        """
+        existing = self.find(entry["grid_hash"])
+        if existing is not None and existing["name"] != entry["name"]:
+            return(existing)
+
+        names = list(catalog_columns)
+        with self.connection:
+            self.connection.execute(f"INSERT OR REPLACE INTO envs ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})", [entry.get(name) for name in names])
+        return(None)
+
+    def next_number(self) -> int:
+        """ one after the highest environment number in the catalog """
+        number = self.connection.execute("SELECT MAX(number) FROM envs").fetchone()[0]
+        return(1 if number is None else number + 1)
+
+    def query(self, order="number", limit=None, **filters) -> list:
+        """
+        list the entries that match all filters, e.g. query(agents=4, max_width=50, max_height=50)
+        a filter is a column name for equality, or min_/max_ and a column name for an inclusive bound
+        """
+        conditions, values = [], []
+        for key, value in filters.items():
+            if value is None:
+                continue
+            operator, column = "=", key
+            if key.startswith("min_") and key[4:] in catalog_columns:
+                operator, column = ">=", key[4:]
+            elif key.startswith("max_") and key[4:] in catalog_columns:
+                operator, column = "<=", key[4:]
+
+            if column not in catalog_columns:
+                raise ValueError(f"Unknown catalog column '{column}'")
+            conditions.append(f"{column} {operator} ?")
+            values.append(value)
+
+        if order not in catalog_columns:
+            raise ValueError(f"Unknown catalog column '{order}'")
+
+        sql = "SELECT * FROM envs"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {order}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+
+        return([dict(row) for row in self.connection.execute(sql, values)])
+
+    def scan(self, path) -> tuple:
+        """
+        add the environments that are already saved in the lp/, pkl/, png/ and npz/ folders of path
+        the arrays are read from the .npz file if there is one, otherwise from the .pkl file
+        returns the number of added and of duplicate environments
+        """
+        files = {}
+        for file_type in file_types:
+            folder = os.path.join(path, file_type)
+            if not os.path.isdir(folder):
+                continue
+            for f in os.listdir(folder):
+                name, extension = os.path.splitext(f)
+                if extension == f".{file_type}":
+                    files.setdefault(name, {})[file_type] = os.path.join(folder, f)
+
+        added, duplicates = 0, 0
+        for name, found in sorted(files.items()):
+            if "npz" in found:
+                data = load_env_data(found["npz"])
+            elif "pkl" in found:
+                with open(found["pkl"], "rb") as f:
+                    data = EnvData(env_arrays(pickle.load(f)))
+            else:
+                continue
+
+            # names of build.py are env_<number>--<agents>_<cities>
+            match = re.match(r"env_(\d+)--\d+_(\d+)$", name)
+            number, cities = (int(match[1]), int(match[2])) if match else (None, None)
+            if self.add(env_entry(data, name, number, cities, files=found)) is None:
+                added += 1
+            else:
+                duplicates += 1
+
+        return(added, duplicates)
@@ -0,0 +1,65 @@
+"""
+custom functions for talking to the solver service of service.py
+
+a job is one JSON object sent as a line over the service's Unix socket, e.g.
+{"job": "solve", "envs": ["envs/npz/env_001--4_2.npz"]} or {"job": "build", "amount": 10};
+the service answers with one JSON line per event: progress events while the job runs, and a
+final result or error event
+"""
+
+import json
+import socket
+
+# socket of a service that was started without --socket
+default_socket = "tmp/service.sock"
+
+
+def request(job, path=default_socket):
+    """
+    send a job to the service and yield its events as dicts until the result or error event
+    raises an OSError (e.g. FileNotFoundError, ConnectionRefusedError) if no service is running
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall((json.dumps(job) + "\n").encode())
+        with sock.makefile("r") as f:
+            for line in f:
+                event = json.loads(line)
+                yield event
+                if event["event"] in ["result", "error"]:
+                    return
+
+    raise ConnectionError("The service closed the connection before the job finished")
+
+
+def run(job, path=default_socket, progress=None) -> dict:
+    """ send a job, pass every progress event to progress(event) and return the result event """
+    for event in request(job, path):
+        if event["event"] == "error":
+            raise RuntimeError(f"The service failed on a {job.get('job')} job: {event['message']}")
+        if event["event"] == "result":
+            return(event)
+        if progress is not None:
+            progress(event)
+
+
+def available(path=default_socket) -> bool:
+    """ whether a service answers on the socket """
+    try:
+        run({"job": "ping"}, path)
+        return(True)
+    except OSError:
+        return(False)
+
+
+def solve(envs, render=True, plan_only=False, path=default_socket, progress=None) -> dict:
+    """ solve a list of environments like solve.py, returns the result with one row per environment """
+    return(run({"job": "solve", "envs": list(envs), "render": render, "plan_only": plan_only}, path, progress))
+
+
+def build(amount, path=default_socket, progress=None, **options) -> dict:
+    """
+    build environments like build.py, options are start, seed, lp, png, pkl and npz
+    returns the result with the names of the new environments
+    """
+    return(run({"job": "build", "amount": amount, **options}, path, progress))
@@ -1,40 +1,92 @@
-from flatland.envs.rail_env import RailEnv
-from flatland.envs.rail_env import RailEnvActions
-from flatland.utils.rendertools import RenderTool, AgentRenderVariant
+import numpy as np
 
+from modules.reach import reachability, expand_windows
+from modules.transitions import successor_edges, track_transitions
+from modules.envfile import EnvData, env_arrays
 
-def convert_to_clingo(env) -> str:
+from flatland.envs.rail_env_action import RailEnvActions
+
+
+def convert_to_clingo(env, empty_cells=True) -> str:
     """
     converts Flatland environment to clingo facts
+    set empty_cells=False to leave out the cell((Y,X), 0) facts of cells without track
+    """
+    if not isinstance(env, EnvData):
+        env = EnvData(env_arrays(env))
+    return(arrays_to_clingo(env, empty_cells))
+
+
+def arrays_to_clingo(data, empty_cells=True) -> str:
+    """
+    converts the arrays of a stored environment (see modules/envfile.py) to clingo facts
+    without building a RailEnv
     """
     # environment properties
-    rail_map = env.rail.grid
-    height, width, agents = env.height, env.width, env.agents
-    clingo_str = f"% clingo representation of a Flatland environment\n% height: {height}, width: {width}, agents: {len(agents)}\n"
+    rail_map = np.asarray(data.grid)
+    height, width, agents = data.height, data.width, len(data.direction)
+    clingo_str = f"% clingo representation of a Flatland environment\n% height: {height}, width: {width}, agents: {agents}\n"
 
     # save start and end positions for each agent
     dir_map = {0:"n", 1:"e", 2:"s", 3:"w"}
     
-    for agent_num, agent_info in enumerate(env.agents):
-        init_y, init_x = agent_info.initial_position
-        goal_y, goal_x = agent_info.target
-        min_start, max_end = agent_info.earliest_departure, agent_info.latest_arrival
-
-        direction = dir_map[agent_info.initial_direction]
+    for agent_num, ((init_y, init_x), (goal_y, goal_x), direction, min_start, max_end) in enumerate(zip(data.start.tolist(), data.target.tolist(), data.direction.tolist(), data.earliest_departure.tolist(), data.latest_arrival.tolist())):
+        direction = dir_map[direction]
         clingo_str += f"\ntrain({agent_num}). "
         clingo_str += f"start({agent_num},({init_y},{init_x}),{min_start},{direction}). "
         clingo_str += f"end({agent_num},({goal_y},{goal_x}),{max_end}).\n"
 
-    # create an atom for each cell in the environment
-    #row_num = len(rail_map) - 1
-    for row, row_array in enumerate(rail_map):
-        for col, cval in enumerate(row_array):
-            clingo_str += f"cell(({row},{col}), {cval}).\n"
-        #row_num -= 1
-        clingo_str+="\n"
+    # select the cells to emit, row by row
+    if empty_cells:
+        rows, cols = np.indices(rail_map.shape).reshape(2, -1)
+    else:
+        rows, cols = np.nonzero(rail_map)
+    tracks = rail_map[rows, cols]
+
+    # format all cell atoms in one pass and join them once
+    cells = map("cell(({},{}), {}).\n".format, rows.tolist(), cols.tolist(), tracks.tolist())
+    clingo_str += "\n" + "".join(cells)
         
     return(clingo_str)
 
+def convert_reach_to_clingo(env) -> str:
+    """
+    converts the reachability windows of each train to clingo facts
+    reachable(ID,(Y,X),D,T) for every state a train can occupy at T, and earliest_arrival(ID,T)
+    """
+    dir_names = np.array(["n", "e", "s", "w"])
+    clingo_str = "% reachable states of each train\n"
+
+    for agent_num, (states, earliest, latest, arrival) in enumerate(reachability(env)):
+        if arrival is not None:
+            clingo_str += f"earliest_arrival({agent_num},{arrival}).\n"
+
+        rows, cols, dirs, timesteps = expand_windows(states, earliest, latest)
+        facts = map(f"reachable({agent_num},({{}},{{}}),{{}},{{}}).\n".format, rows.tolist(), cols.tolist(), dir_names[dirs].tolist(), timesteps.tolist())
+        clingo_str += "".join(facts)
+
+    return(clingo_str)
+
+
+def convert_succ_to_clingo(env) -> str:
+    """
+    converts the transitions of the rail grid to clingo facts
+    trans(TrackID, D, D2, Move) for every track ID on the map, which replaces asp/trans.lp,
+    and succ((Y,X), D, Move, (Y2,X2), D2) for every transition of every cell
+    """
+    dir_names = np.array(["n", "e", "s", "w"])
+    clingo_str = "% transitions of the track IDs on the map\n"
+
+    trans = map(lambda t: f"trans({t[0]}, {dir_names[t[1]]}, {dir_names[t[2]]}, {t[3]}).\n", track_transitions(env.rail.grid))
+    clingo_str += "".join(trans)
+
+    edges, moves = successor_edges(env.rail.grid)
+    succ = map("succ(({},{}),{},{},({},{}),{}).\n".format, edges[:, 0].tolist(), edges[:, 1].tolist(), dir_names[edges[:, 2]].tolist(), moves.tolist(), edges[:, 3].tolist(), edges[:, 4].tolist(), dir_names[edges[:, 5]].tolist())
+    clingo_str += "".join(succ)
+
+    return(clingo_str)
+
+
 def convert_formers_to_clingo(actions) -> str:
     # change back to the clingo names
     mapping = {RailEnvActions.MOVE_FORWARD:"move_forward", RailEnvActions.MOVE_RIGHT:"move_right", RailEnvActions.MOVE_LEFT:"move_left", RailEnvActions.STOP_MOVING:"wait"}
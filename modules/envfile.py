@@ -0,0 +1,199 @@
+"""
+custom functions for storing environments compactly
+
+an environment is stored as the arrays that define it, in a compressed .npz file: the uint16 rail
+grid, one row per agent of start, target, direction, earliest departure, latest arrival and speed,
+the malfunction parameters and the state of its random generator; facts and checks work on these
+arrays directly, and a RailEnv is only rebuilt from them when a simulation or rendering needs one
+
+this module does not import Flatland unless a RailEnv is built, so that planning from a stored
+environment starts quickly
+"""
+
+import pickle
+from types import SimpleNamespace
+
+import numpy as np
+
+
+class EnvData():
+    """
+    the arrays of a stored environment
+    grid (height, width), start and target (agents, 2), direction, earliest_departure,
+    latest_arrival and speed (agents), malfunction (rate, min_duration, max_duration),
+    remove_agents_at_target, max_episode_steps, and rng_keys, rng_pos, rng_gauss if the
+    environment had a RandomState
+
+    like a RailEnv, it has rail.grid and agents with the initial_position, initial_direction,
+    target, earliest_departure and latest_arrival of each agent, which is all that planning needs
+    """
+
+    def __init__(self, arrays):
+        self.arrays = dict(arrays)
+        self.env = None
+        self.agent_list = None
+
+    def __getattr__(self, name):
+        try:
+            return(self.__dict__["arrays"][name])
+        except KeyError:
+            raise AttributeError(name)
+
+    @property
+    def height(self) -> int:
+        return(self.grid.shape[0])
+
+    @property
+    def width(self) -> int:
+        return(self.grid.shape[1])
+
+    @property
+    def rail(self) -> SimpleNamespace:
+        return(SimpleNamespace(grid=self.grid))
+
+    @property
+    def agents(self) -> list:
+        if self.agent_list is None:
+            self.agent_list = [
+                SimpleNamespace(handle=handle, initial_position=tuple(start), initial_direction=direction, target=tuple(target), earliest_departure=earliest, latest_arrival=latest)
+                for handle, (start, target, direction, earliest, latest) in enumerate(zip(self.start.tolist(), self.target.tolist(), self.direction.tolist(), self.earliest_departure.tolist(), self.latest_arrival.tolist()))
+            ]
+        return(self.agent_list)
+
+    def rail_env(self) -> "RailEnv":
+        """ rebuild the RailEnv on the first call and return the same one afterwards """
+        if self.env is None:
+            self.env = build_rail_env(self)
+        return(self.env)
+
+
+class LineFromArrays():
+    """ line generator that places the agents of stored arrays, picklable for rendering processes """
+
+    def __init__(self, data):
+        from flatland.envs.timetable_utils import Line
+
+        self.line = Line(
+            agent_positions=list(map(tuple, data.start.tolist())),
+            agent_directions=data.direction.tolist(),
+            agent_targets=list(map(tuple, data.target.tolist())),
+            agent_speeds=data.speed.tolist()
+        )
+
+    def __call__(self, *args, **kwargs):
+        return(self.line)
+
+
+def env_arrays(env) -> dict:
+    """ extract the arrays of an EnvData from a RailEnv """
+    agents = env.agents
+    arrays = {
+        "grid": np.asarray(env.rail.grid, dtype=np.uint16),
+        "start": np.array([agent.initial_position for agent in agents], dtype=np.int32).reshape(-1, 2),
+        "target": np.array([agent.target for agent in agents], dtype=np.int32).reshape(-1, 2),
+        "direction": np.array([agent.initial_direction for agent in agents], dtype=np.int8),
+        "earliest_departure": np.array([agent.earliest_departure for agent in agents], dtype=np.int32),
+        "latest_arrival": np.array([agent.latest_arrival for agent in agents], dtype=np.int32),
+        "speed": np.array([agent.speed_counter.speed for agent in agents], dtype=np.float64),
+        "remove_agents_at_target": np.array(env.remove_agents_at_target),
+        "max_episode_steps": np.array(env._max_episode_steps, dtype=np.int32)
+    }
+
+    parameters = getattr(env.malfunction_generator, "MFP", None)
+    if parameters is not None:
+        arrays["malfunction"] = np.array([parameters.malfunction_rate, parameters.min_duration, parameters.max_duration], dtype=np.float64)
+    else:
+        arrays["malfunction"] = np.array([0, 0, 0], dtype=np.float64)
+
+    # the malfunctions of a simulation are drawn from this generator, so its state is kept as well
+    if isinstance(env.np_random, np.random.RandomState):
+        _, keys, pos, has_gauss, cached_gaussian = env.np_random.get_state()
+        arrays["rng_keys"] = keys
+        arrays["rng_pos"] = np.array(pos)
+        arrays["rng_gauss"] = np.array([has_gauss, cached_gaussian], dtype=np.float64)
+
+    return(arrays)
+
+
+def check_env(data) -> None:
+    """ verify that the arrays of an EnvData describe a consistent environment """
+    agents = len(data.direction)
+    for name in ["start", "target"]:
+        if getattr(data, name).shape != (agents, 2):
+            raise ValueError(f"'{name}' should have shape ({agents}, 2), but has {getattr(data, name).shape}")
+        rows, cols = getattr(data, name).T
+        if np.any((rows < 0) | (rows >= data.height) | (cols < 0) | (cols >= data.width)):
+            raise ValueError(f"'{name}' has positions outside of the {data.height}x{data.width} grid")
+        if np.any(data.grid[rows, cols] == 0):
+            raise ValueError(f"'{name}' has positions without track")
+
+    for name in ["earliest_departure", "latest_arrival", "speed"]:
+        if len(getattr(data, name)) != agents:
+            raise ValueError(f"'{name}' should have {agents} values, but has {len(getattr(data, name))}")
+
+    if np.any((data.direction < 0) | (data.direction > 3)):
+        raise ValueError("'direction' has values outside of 0..3")
+    if np.any(data.earliest_departure > data.latest_arrival):
+        raise ValueError("'earliest_departure' is after 'latest_arrival' for some agents")
+
+
+def build_rail_env(data) -> "RailEnv":
+    """ rebuild a RailEnv, reset to its first timestep, from the arrays of an EnvData """
+    from flatland.envs.rail_env import RailEnv
+    from flatland.envs.rail_generators import rail_from_grid_transition_map
+    from flatland.envs.observations import GlobalObsForRailEnv
+    from flatland.envs.malfunction_generators import MalfunctionParameters, ParamMalfunctionGen
+    from flatland.core.transition_map import GridTransitionMap
+    from flatland.core.grid.rail_env_grid import RailEnvTransitions
+
+    rail = GridTransitionMap(width=data.width, height=data.height, transitions=RailEnvTransitions())
+    rail.grid = np.array(data.grid, dtype=np.uint16)
+
+    rate, min_duration, max_duration = data.malfunction.tolist()
+    env = RailEnv(
+                width= data.width,
+                height= data.height,
+                rail_generator= rail_from_grid_transition_map(rail),
+                line_generator= LineFromArrays(data),
+                number_of_agents= len(data.direction),
+                obs_builder_object= GlobalObsForRailEnv(),
+                malfunction_generator=ParamMalfunctionGen(MalfunctionParameters(malfunction_rate=rate, min_duration=int(min_duration), max_duration=int(max_duration))),
+                remove_agents_at_target= bool(data.remove_agents_at_target)
+                )
+
+    # reset draws a new timetable, which is replaced by the stored one afterwards
+    env.np_random = np.random.RandomState(0)
+    env.reset()
+    for agent, earliest, latest in zip(env.agents, data.earliest_departure.tolist(), data.latest_arrival.tolist()):
+        agent.earliest_departure = earliest
+        agent.latest_arrival = latest
+    env._max_episode_steps = int(data.max_episode_steps)
+
+    if "rng_keys" in data.arrays:
+        has_gauss, cached_gaussian = data.rng_gauss.tolist()
+        env.np_random.set_state(("MT19937", data.rng_keys, int(data.rng_pos), int(has_gauss), cached_gaussian))
+
+    return(env)
+
+
+def save_env(filename, env) -> None:
+    """ save a RailEnv as a compressed .npz file """
+    np.savez_compressed(filename, **env_arrays(env))
+
+
+def load_env_data(filename) -> EnvData:
+    """ load and check the arrays of a .npz environment without building a RailEnv """
+    with np.load(filename) as arrays:
+        data = EnvData({name: arrays[name] for name in arrays.files})
+
+    check_env(data)
+    return(data)
+
+
+def load_env(filename) -> "RailEnv":
+    """ load a RailEnv from a .npz or .pkl file """
+    if filename.endswith(".npz"):
+        return(load_env_data(filename).rail_env())
+
+    with open(filename, "rb") as f:
+        return(pickle.load(f))
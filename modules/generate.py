@@ -0,0 +1,133 @@
+"""
+custom functions for generating Flatland environments
+
+every environment index has its own seed, derived from the base seed, so that the same
+environments are built no matter how many processes build them or in which order; an index
+whose generation fails is retried with the next seed derived for that index only
+"""
+
+import os
+import random
+import multiprocessing
+
+import numpy as np
+
+from modules.save import save_lp, save_png, save_pkl, save_npz
+from modules.convert import convert_to_clingo
+from modules.envfile import EnvData, env_arrays
+from modules.catalog import env_entry
+
+
+def derive_seed(seed, index, attempt=0) -> int:
+    """ derive the seed of one attempt at building an environment index from the base seed """
+    return(int(np.random.SeedSequence([seed, index, attempt]).generate_state(1)[0]))
+
+
+def make_env(par, seed) -> "RailEnv":
+    """ build a Flatland environment from a dict of envs/params.py values and a seed """
+    # imported by the building processes only, the main process just keeps the catalog
+    from flatland.envs.rail_env import RailEnv
+    from flatland.envs.rail_generators import sparse_rail_generator
+    from flatland.envs.line_generators import sparse_line_generator
+    from flatland.envs.observations import GlobalObsForRailEnv
+    from flatland.envs.malfunction_generators import MalfunctionParameters, ParamMalfunctionGen
+
+    rail_generator = sparse_rail_generator(
+                max_num_cities= par["max_num_cities"],
+                seed= seed,
+                grid_mode= par["grid_mode"],
+                max_rails_between_cities= par["max_rails_between_cities"],
+                max_rail_pairs_in_city= par["max_rail_pairs_in_city"],
+                )
+
+    stochastic_data = MalfunctionParameters(
+                malfunction_rate= par["malfunction_rate"],
+                min_duration= par["min_duration"],
+                max_duration= par["max_duration"]
+                )
+
+    env = RailEnv(
+                width= par["width"],
+                height= par["height"],
+                rail_generator= rail_generator,
+                line_generator= sparse_line_generator(par["speed_ratio_map"]),
+                number_of_agents= par["number_of_agents"],
+                obs_builder_object= GlobalObsForRailEnv(),
+                malfunction_generator=ParamMalfunctionGen(stochastic_data),
+                remove_agents_at_target= par["remove_agents_at_target"]
+                )
+
+    # flatland's generators expect a RandomState, which newer gym versions no longer return from their seeding
+    env.np_random = np.random.RandomState(seed)
+    env.random_seed = seed
+    random.seed(seed)
+    env.reset()
+    return(env)
+
+
+def generate_env(par, index, retries=10) -> tuple:
+    """
+    build the environment of one index, retrying with derived seeds if generation fails
+    (the sparse rail generator intermittently raises an OverflowError for uint16 values)
+    returns the environment, the seed that was used and the number of attempts
+    """
+    for attempt in range(retries + 1):
+        seed = derive_seed(par["seed"], index, attempt)
+        try:
+            return(make_env(par, seed), seed, attempt + 1)
+        except OverflowError as e:
+            error = e
+
+    raise RuntimeError(f"Environment {index} failed after {retries + 1} attempts: {type(error).__name__}: {error}")
+
+
+def build_env(par, index, path, lp=True, png=True, pkl=True, npz=True, retries=10) -> dict:
+    """
+    build and save the environment of one index
+    returns the file name, the seed that was used, the number of attempts and the catalog entry
+    """
+    env, seed, attempts = generate_env(par, index, retries)
+
+    # save files
+    file_name = f"env_{index:03d}--{par['number_of_agents']}_{par['max_num_cities']}"
+    if lp:
+        save_lp(convert_to_clingo(env), file_name, path)
+    if png:
+        save_png(env, file_name, path)
+    if pkl:
+        save_pkl(env, file_name, path)
+    if npz:
+        save_npz(env, file_name, path)
+
+    files = {file_type: os.path.relpath(f"{path}{file_type}/{file_name}.{file_type}") for file_type, saved in [("lp", lp), ("pkl", pkl), ("png", png), ("npz", npz)] if saved}
+    entry = env_entry(EnvData(env_arrays(env)), file_name, index, par["max_num_cities"], seed, files)
+
+    return({"index": index, "file_name": file_name, "seed": seed, "attempts": attempts, "entry": entry})
+
+
+def build_task(task) -> dict:
+    """ unpack the arguments of build_env for a process pool """
+    par, index, path, formats = task
+    return(build_env(par, index, path, **formats))
+
+
+def build_envs(par, indices, path, workers=1, lp=True, png=True, pkl=True, npz=True, pool=None):
+    """
+    build the environments of the given indices in a pool of processes
+    an existing pool can be passed, e.g. the one of a long-running service
+    yields the result of every build_env call as it finishes
+    """
+    formats = {"lp": lp, "png": png, "pkl": pkl, "npz": npz}
+    tasks = [(par, index, path, formats) for index in indices]
+
+    if pool is not None:
+        yield from pool.imap_unordered(build_task, tasks)
+        return
+
+    if workers == 1:
+        for task in tasks:
+            yield build_task(task)
+        return
+
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap_unordered(build_task, tasks)
@@ -0,0 +1,232 @@
+"""
+custom functions for attributing the size of a ground program to the rules of its encodings
+
+the program is grounded twice while an observer records every ground rule: once as it is, for the
+atoms and rules per predicate, and once with every rule of the encodings extended by an external
+marker atom groundsize_rule(I), so that each ground rule carries the index of the rule it was
+instantiated from; since the facts of the first grounding are added as facts to the second, rules
+that only derive facts are dropped and the bodies are simplified like in the first grounding,
+so the counts per rule add up to the program that is solved
+
+auxiliary rules of aggregates and conditional literals count towards the rule that uses them;
+only the base program is grounded, so incremental encodings such as asp/flat_inc.lp are not covered
+"""
+
+import math
+
+import clingo
+from clingo import ast
+
+from modules.inject import env_to_symbols, reach_to_symbols, succ_to_symbols, add_facts
+
+# name of the marker atoms, which must not be used by an encoding
+marker = "groundsize_rule"
+
+# columns of the tables per rule and per predicate
+rule_columns = ["rule", "rules", "atoms", "body", "choice", "location", "source"]
+predicate_columns = ["predicate", "atoms", "facts", "rules", "body"]
+
+
+class RuleObserver():
+    """ records the head atoms and body literals of every ground rule """
+
+    def __init__(self):
+        # (head atoms, body literals, is choice) of every rule, including weight rules
+        self.rules = []
+        # number of literals of each priority level of the minimize statements, and their atoms
+        self.minimize_literals = {}
+        self.minimize_atoms = set()
+
+    def rule(self, choice, head, body):
+        self.rules.append((list(head), list(body), choice))
+
+    def weight_rule(self, choice, head, lower_bound, body):
+        self.rules.append((list(head), [literal for literal, _ in body], choice))
+
+    def minimize(self, priority, literals):
+        self.minimize_literals[priority] = self.minimize_literals.get(priority, 0) + len(literals)
+        self.minimize_atoms.update(abs(literal) for literal, _ in literals)
+
+
+def env_symbols(env, prune=False, successors=False) -> list:
+    """ the facts of an environment as symbols, with the facts of pruned and successor encodings if needed """
+    symbols = env_to_symbols(env)
+    if prune:
+        symbols += reach_to_symbols(env)
+    if successors:
+        symbols += succ_to_symbols(env)
+    return(symbols)
+
+
+def file_symbols(filename) -> list:
+    """ the facts of an .lp file as symbols """
+    ctl = clingo.Control(["--warn=none"])
+    ctl.load(filename)
+    ctl.ground([("base", [])])
+    return([atom.symbol for atom in ctl.symbolic_atoms])
+
+
+def ground_observed(facts, load) -> tuple:
+    """
+    ground the facts and the program that load(ctl) adds, with an observer
+    returns the observer, a dict from program literals to their symbols and the set of literals that are facts
+    """
+    ctl = clingo.Control(["--warn=none"])
+    observer = RuleObserver()
+    ctl.register_observer(observer)
+
+    # facts first, else clingo reports their signatures as missing
+    add_facts(ctl, facts)
+    load(ctl)
+    ctl.ground([("base", [])])
+
+    symbols = {atom.literal: atom.symbol for atom in ctl.symbolic_atoms}
+    facts = {atom.literal for atom in ctl.symbolic_atoms if atom.is_fact}
+    return(observer, symbols, facts)
+
+
+def mark_rules(files) -> tuple:
+    """
+    parse the encodings and extend the body of every rule with its marker atom
+    returns the statements and, per rule index, its location and source text
+    """
+    statements = []
+    labels = []
+
+    def add(statement):
+        if statement.ast_type != ast.ASTType.Rule:
+            statements.append(statement)
+            return
+
+        index = len(labels)
+        location = statement.location
+        labels.append((f"{location.begin.filename}:{location.begin.line}", str(statement)))
+
+        # the marker is external, so that its rules are neither simplified nor dropped
+        literal = []
+        ast.parse_string(f":- {marker}({index}).", lambda s: literal.extend(s.body) if s.ast_type == ast.ASTType.Rule else None)
+        statements.append(statement.update(body=list(statement.body) + literal))
+        ast.parse_string(f"#external {marker}({index}).", lambda s: statements.append(s) if s.ast_type == ast.ASTType.External else None)
+
+    ast.parse_files(files, add)
+    return(statements, labels)
+
+
+def profile_rules(facts, files) -> tuple:
+    """
+    attribute the ground program of the facts and encodings to the rules of the encodings
+    returns a row per source rule and a row per predicate, both sorted by the number of ground rules,
+    and the number of literals per priority of the minimize statements
+    """
+    # the program as it is solved
+    def load(ctl):
+        for f in files:
+            ctl.load(f)
+
+    observer, symbols, fact_atoms = ground_observed(facts, load)
+
+    # per predicate
+    predicates = {}
+    for literal, symbol in symbols.items():
+        row = predicates.setdefault(f"{symbol.name}/{len(symbol.arguments)}", {"atoms": 0, "facts": 0, "rules": 0, "body": 0})
+        row["facts" if literal in fact_atoms else "atoms"] += 1
+    for head, body, _ in observer.rules:
+        if not body and len(head) == 1 and head[0] in fact_atoms:
+            continue
+        # integrity constraints and auxiliary atoms have no predicate
+        names = {f"{symbols[atom].name}/{len(symbols[atom].arguments)}" for atom in head if atom in symbols} or {"#constraint" if not head else "#aux"}
+        for name in names:
+            row = predicates.setdefault(name, {"atoms": 0, "facts": 0, "rules": 0, "body": 0})
+            row["rules"] += 1
+            row["body"] += len(body)
+
+    # the derived facts of the first grounding make the second one ground the same program
+    statements, labels = mark_rules(files)
+    derived_facts = [symbols[atom] for atom in fact_atoms if atom in symbols]
+
+    def load_marked(ctl):
+        with ast.ProgramBuilder(ctl) as builder:
+            for statement in statements:
+                builder.add(statement)
+
+    marked, marked_symbols, _ = ground_observed(list(set(facts) | set(derived_facts)), load_marked)
+    markers = {literal: symbol.arguments[0].number for literal, symbol in marked_symbols.items() if symbol.name == marker}
+
+    rows = [{"rule": index, "rules": 0, "atoms": set(), "body": 0, "choice": False, "location": location, "source": source} for index, (location, source) in enumerate(labels)]
+    rows.append({"rule": "-", "rules": 0, "atoms": set(), "body": 0, "choice": False, "location": "", "source": "#minimize"})
+
+    # auxiliary atoms (those without a symbol) belong to the rule whose ground rules use them
+    owners = {atom: len(labels) for atom in marked.minimize_atoms if atom not in marked_symbols}
+    pending = []
+    for head, body, choice in marked.rules:
+        index = next((markers[literal] for literal in body if literal in markers), None)
+        if index is None:
+            # facts need no attribution
+            if body or any(atom not in marked_symbols for atom in head):
+                pending.append((head, body, choice))
+            continue
+
+        body = [literal for literal in body if literal not in markers]
+        add_rule(rows[index], head, body, choice, marked_symbols)
+        owners.update((atom, index) for atom in auxiliary(head, body, marked_symbols))
+
+    # rules of auxiliary atoms, such as those of aggregates, may depend on each other
+    while pending:
+        remaining = []
+        for head, body, choice in pending:
+            atoms = auxiliary(head, body, marked_symbols)
+            index = next((owners[atom] for atom in atoms if atom in owners), None)
+            if index is None:
+                remaining.append((head, body, choice))
+                continue
+            add_rule(rows[index], head, body, choice, marked_symbols)
+            for atom in atoms:
+                owners.setdefault(atom, index)
+        if len(remaining) == len(pending):
+            break
+        pending = remaining
+
+    # what is left are mostly projections of body literals with anonymous variables, e.g. position(ID,_,_,T),
+    # whose atoms no ground rule uses, so they are grouped by the predicates they project
+    others = {}
+    for head, body, choice in pending:
+        names = sorted({f"{marked_symbols[abs(literal)].name}/{len(marked_symbols[abs(literal)].arguments)}" for literal in body if abs(literal) in marked_symbols})
+        source = f"(auxiliary rules on {', '.join(names)})" if names else "(auxiliary facts)" if not body else "(auxiliary rules)"
+        if source not in others:
+            others[source] = {"rule": "-", "rules": 0, "atoms": set(), "body": 0, "choice": False, "location": "", "source": source}
+            rows.append(others[source])
+        add_rule(others[source], head, body, choice, marked_symbols)
+
+    for row in rows:
+        row["atoms"] = len(row["atoms"])
+
+    predicate_rows = [{"predicate": name, **row} for name, row in predicates.items()]
+    return(sorted(rows, key=lambda row: row["rules"], reverse=True), sorted(predicate_rows, key=lambda row: row["rules"], reverse=True), observer.minimize_literals)
+
+
+def auxiliary(head, body, symbols) -> list:
+    """ the auxiliary atoms of a ground rule """
+    return([abs(literal) for literal in head + body if abs(literal) not in symbols])
+
+
+def add_rule(row, head, body, choice, symbols) -> None:
+    """ count a ground rule towards the row of its source rule """
+    row["rules"] += 1
+    row["body"] += len(body)
+    row["choice"] = row["choice"] or choice
+    row["atoms"].update(atom for atom in head if atom in symbols)
+
+
+def growth(points) -> float:
+    """
+    the exponent k of the best fit of count = c * scale^k over (scale, count) points,
+    e.g. 1 for rules that grow linearly with the number of agents and 2 for quadratic ones
+    returns None if fewer than two points have a count
+    """
+    points = [(math.log(scale), math.log(count)) for scale, count in points if scale > 0 and count > 0]
+    if len(points) < 2 or len({x for x, _ in points}) < 2:
+        return(None)
+
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    return(sum((x - mean_x) * (y - mean_y) for x, y in points) / sum((x - mean_x)**2 for x, _ in points))
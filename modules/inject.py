@@ -0,0 +1,150 @@
+"""
+custom functions for adding facts directly to clingo's ground program
+
+these mirror the text converters in modules/convert.py, but build clingo symbols
+and write them through ctl.backend(), so that clingo does not have to parse them
+"""
+
+import numpy as np
+from clingo.symbol import Function, Number, Tuple_
+
+from modules.reach import reachability, expand_windows
+from modules.transitions import successor_edges, track_transitions
+
+dir_map = {0:"n", 1:"e", 2:"s", 3:"w"}
+action_map = {1:"move_left", 2:"move_forward", 3:"move_right", 4:"wait"}
+
+
+def coordinate(y, x):
+    """ build the (Y,X) tuple symbol of a cell """
+    return(Tuple_([Number(int(y)), Number(int(x))]))
+
+
+def action_symbol(train, move, timestep):
+    """ build the action(train(ID), Move, Timestep) symbol """
+    return(Function("action", [Function("train", [Number(int(train))]), Function(move), Number(int(timestep))]))
+
+
+def env_to_symbols(env, empty_cells=False) -> list:
+    """
+    converts Flatland environment to clingo symbols
+    same atoms as convert_to_clingo, but as train/1, start/4, end/3 and cell/2 symbols
+    """
+    symbols = []
+    for agent_num, agent_info in enumerate(env.agents):
+        init_y, init_x = agent_info.initial_position
+        goal_y, goal_x = agent_info.target
+        min_start, max_end = agent_info.earliest_departure, agent_info.latest_arrival
+        direction = dir_map[agent_info.initial_direction]
+
+        symbols.append(Function("train", [Number(agent_num)]))
+        symbols.append(Function("start", [Number(agent_num), coordinate(init_y, init_x), Number(int(min_start)), Function(direction)]))
+        symbols.append(Function("end", [Number(agent_num), coordinate(goal_y, goal_x), Number(int(max_end))]))
+
+    rail_map = np.asarray(env.rail.grid)
+    if empty_cells:
+        rows, cols = np.indices(rail_map.shape).reshape(2, -1)
+    else:
+        rows, cols = np.nonzero(rail_map)
+    tracks = rail_map[rows, cols]
+
+    for row, col, track in zip(rows.tolist(), cols.tolist(), tracks.tolist()):
+        symbols.append(Function("cell", [coordinate(row, col), Number(track)]))
+
+    return(symbols)
+
+
+def reach_to_symbols(env) -> list:
+    """
+    converts the reachability windows of each train to clingo symbols
+    same atoms as convert_reach_to_clingo
+    """
+    symbols = []
+    headings = [Function(dir_map[d]) for d in range(4)]
+    for agent_num, (states, earliest, latest, arrival) in enumerate(reachability(env)):
+        if arrival is not None:
+            symbols.append(Function("earliest_arrival", [Number(agent_num), Number(arrival)]))
+
+        train = Number(agent_num)
+        for row, col, heading, timestep in zip(*(a.tolist() for a in expand_windows(states, earliest, latest))):
+            symbols.append(Function("reachable", [train, coordinate(row, col), headings[heading], Number(timestep)]))
+
+    return(symbols)
+
+
+def succ_to_symbols(env) -> list:
+    """
+    converts the transitions of the rail grid to clingo symbols
+    same atoms as convert_succ_to_clingo
+    """
+    headings = [Function(dir_map[d]) for d in range(4)]
+    symbols = []
+    for track, heading, new_heading, move in track_transitions(env.rail.grid):
+        symbols.append(Function("trans", [Number(track), headings[heading], headings[new_heading], Function(move)]))
+
+    edges, moves = successor_edges(env.rail.grid)
+    for (y, x, d, ny, nx, nd), move in zip(edges.tolist(), moves.tolist()):
+        symbols.append(Function("succ", [coordinate(y, x), headings[d], Function(move), coordinate(ny, nx), headings[nd]]))
+
+    return(symbols)
+
+
+def formers_to_symbols(actions) -> list:
+    """
+    actions that have already been executed, as action/3 symbols that must hold
+    same as the constraints from convert_formers_to_clingo
+    """
+    required = []
+    for index, step in enumerate(actions):
+        for train, command in step.items():
+            required.append(action_symbol(train, action_map[int(command)], index))
+
+    return(required)
+
+
+def malfunctions_to_symbols(malfs, timestep) -> tuple:
+    """
+    malfunction/3 facts and the wait actions that must hold while a train is broken
+    same as convert_malfunctions_to_clingo
+    """
+    facts, required = [], []
+    for train, duration in malfs:
+        facts.append(Function("malfunction", [Number(int(train)), Number(int(duration)), Number(int(timestep))]))
+        for t in range(timestep+1, timestep+1+duration):
+            required.append(action_symbol(train, "wait", t))
+
+    return(facts, required)
+
+
+def futures_to_symbols(actions) -> list:
+    """
+    actions that were previously planned, as planned_action/3 facts
+    same as convert_futures_to_clingo
+    """
+    facts = []
+    for index, step in enumerate(actions):
+        for train, command in step.items():
+            symbol = action_symbol(train, action_map[int(command)], index)
+            facts.append(Function("planned_action", symbol.arguments))
+
+    return(facts)
+
+
+def add_facts(ctl, symbols) -> None:
+    """
+    add symbols as facts to the ground program
+    must be called before grounding, so that rules can be instantiated with them
+    """
+    with ctl.backend() as backend:
+        for symbol in symbols:
+            backend.add_rule([backend.add_atom(symbol)])
+
+
+def add_required(ctl, symbols) -> None:
+    """
+    add a constraint ':- not Symbol.' for each symbol
+    must be called after grounding, so that the constraints refer to the grounded atoms
+    """
+    with ctl.backend() as backend:
+        for symbol in symbols:
+            backend.add_rule([], [-backend.add_atom(symbol)])
@@ -0,0 +1,126 @@
+"""
+custom functions for building and solving environments in one process
+
+a BuildConfig holds the parameters of envs/params.py and a SolveConfig those of asp/params.py,
+so that a pipeline is configured without rewriting the params files; the environment, plan, log
+and timings are returned in memory, and several pipelines can run at the same time in separate
+processes
+"""
+
+import multiprocessing
+from dataclasses import dataclass, field, fields, asdict
+
+from modules.generate import generate_env
+
+
+@dataclass
+class BuildConfig():
+    """ the parameters of envs/params.py """
+    width: int = 40
+    height: int = 40
+    number_of_agents: int = 4
+    max_num_cities: int = 2
+    seed: int = 1
+    grid_mode: bool = False
+    max_rails_between_cities: int = 2
+    max_rail_pairs_in_city: int = 2
+    remove_agents_at_target: bool = True
+    speed_ratio_map: dict = field(default_factory=lambda: {1: 1})
+    malfunction_rate: float = 0.0
+    min_duration: int = 2
+    max_duration: int = 6
+
+    def __post_init__(self):
+        from build import check_params
+        check_params(self)
+
+
+@dataclass
+class SolveConfig():
+    """ the parameters of asp/params.py """
+    primary: list = field(default_factory=lambda: ['asp/flat.lp', 'asp/trans.lp'])
+    secondary: list = field(default_factory=list)
+    inject: bool = True
+    prune: bool = False
+    persistent: bool = False
+    incremental: bool = False
+    successors: bool = False
+    cache: bool = False
+    cache_size: int = 512*1024**2
+    threads: int = 1
+    configuration: str = 'auto'
+    opt_strategy: str = 'bb'
+    portfolio: list = field(default_factory=list)
+    budget: float = None
+    replan_budget: float = None
+
+    def __post_init__(self):
+        from solve import check_params
+        check_params(self)
+
+
+@dataclass
+class PipelineResult():
+    """ an environment, its final plan and the record of its simulation """
+    env: object
+    seed: int
+    actions: list
+    done: bool
+    states: list
+    log: object
+    ground_time: float
+    solve_time: float
+    cost: list
+    optimal: bool
+
+    @property
+    def arrived(self) -> int:
+        """ the number of trains that reached their target """
+        # state 6 is done, see state_names in modules/trace.py
+        return(sum(int(agent.state) == 6 for agent in self.env.agents))
+
+
+def from_params(config_class, module):
+    """ read a BuildConfig or SolveConfig from a params module, e.g. from_params(SolveConfig, asp.params) """
+    return(config_class(**{f.name: getattr(module, f.name) for f in fields(config_class) if hasattr(module, f.name)}))
+
+
+def build(config, index=1) -> tuple:
+    """
+    build the environment of one index from a BuildConfig, see modules/generate.py for the seeds
+    returns the environment and the seed it was built from
+    """
+    env, seed, _ = generate_env(asdict(config), index)
+    return(env, seed)
+
+
+def solve(env, config, seed=None) -> PipelineResult:
+    """ plan and simulate an environment with a SolveConfig, replanning after malfunctions """
+    from solve import build_manager, simulate, OutputLogManager
+
+    sim = build_manager(env, config)
+    log = OutputLogManager()
+    actions, done, states = simulate(env, sim, log)
+    return(PipelineResult(env, seed, actions, done, states, log, sim.ground_time, sim.solve_time, sim.cost, sim.optimal))
+
+
+def run(build_config, solve_config, index=1) -> PipelineResult:
+    """ build, convert, solve and simulate one environment """
+    env, seed = build(build_config, index)
+    return(solve(env, solve_config, seed))
+
+
+def run_task(task) -> PipelineResult:
+    """ unpack the arguments of run for a process pool """
+    return(run(*task))
+
+
+def run_many(tasks, workers=None) -> list:
+    """
+    run pipelines of (build_config, solve_config, index) tuples in a pool of processes
+    returns their results in the order of the tasks
+    """
+    # spawn, so that every pipeline starts from fresh module state
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(workers) as pool:
+        return(pool.map(run_task, tasks))
@@ -0,0 +1,97 @@
+"""
+custom functions for configuring clingo's solvers
+
+a single plan takes a thread count, a solver configuration and an optimization strategy as
+clingo options; a portfolio of configurations can also be raced in separate processes
+"""
+
+import multiprocessing
+from multiprocessing.connection import wait
+from types import SimpleNamespace
+
+from clingo.application import clingo_main
+
+from modules.api import FlatlandPlan
+
+
+def solver_options(threads=1, configuration=None, opt_strategy=None) -> list:
+    """
+    build the clingo command line options for a thread count, a configuration
+    (auto, frumpy, jumpy, tweety, handy, crafty, trendy, many) and an optimization strategy (bb, usc)
+    """
+    options = []
+    if threads > 1:
+        options.append(f"--parallel-mode={threads},compete")
+    if configuration:
+        options.append(f"--configuration={configuration}")
+    if opt_strategy:
+        options.append(f"--opt-strategy={opt_strategy}")
+
+    return(options)
+
+
+def racer(env, actions, files, plan_options, conn) -> None:
+    """ plan with one configuration in a child process and send the result """
+    app = FlatlandPlan(env, actions, **plan_options)
+    clingo_main(app, files)
+    conn.send({
+        "action_list": app.action_list,
+        "cost": app.cost,
+        "optimal": app.optimal,
+        "ground_time": app.ground_time,
+        "solve_time": app.solve_time
+    })
+    conn.close()
+
+
+def race(env, actions, files, portfolio, **plan_options) -> SimpleNamespace:
+    """
+    plan with every (configuration, opt_strategy) pair of the portfolio in its own single-threaded process
+    every racer optimizes until its plan is proven optimal (or its budget runs out), the first proven
+    optimal plan wins and the others are terminated; if no racer proves its plan optimal, the plan
+    with the lowest cost wins once all racers have finished
+    returns the winner's action_list, cost, optimal flag, timings and configuration
+    """
+    # fork, so that the environment and context symbols do not have to be pickled
+    context = multiprocessing.get_context("fork")
+    plan_options = {**plan_options, "optimize": True}
+    racers = {}
+    for configuration, opt_strategy in portfolio:
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=racer, args=(env, actions, files + solver_options(1, configuration, opt_strategy), plan_options, sender))
+        process.start()
+        sender.close()
+        racers[receiver] = (process, configuration, opt_strategy)
+
+    winner = None
+    best = None
+    pending = list(racers)
+    while pending and winner is None:
+        for receiver in wait(pending):
+            pending.remove(receiver)
+            try:
+                result = receiver.recv()
+            except EOFError:
+                # the racer crashed, the others may still finish
+                continue
+            _, configuration, opt_strategy = racers[receiver]
+            finished = SimpleNamespace(configuration=configuration, opt_strategy=opt_strategy, **result)
+            if finished.optimal:
+                winner = finished
+                break
+
+            # a plan beats no plan (unsatisfiable), and a lower cost beats a higher one
+            if best is None or (finished.action_list and (not best.action_list or finished.cost < best.cost)):
+                best = finished
+
+    # killed rather than terminated, since clingo turns SIGTERM into an interrupted search and a traceback
+    for process, _, _ in racers.values():
+        if process.is_alive():
+            process.kill()
+        process.join()
+
+    winner = winner or best
+    if winner is None:
+        raise Exception('No configuration of the portfolio finished.')
+
+    return(winner)
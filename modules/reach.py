@@ -0,0 +1,87 @@
+"""
+custom functions for reachability analysis of the time-expanded search space
+
+a train can only be at a (cell, heading) state at time T if the state can be reached
+from its start by T, and its target can still be reached from the state by its latest arrival
+"""
+
+from collections import deque
+
+import numpy as np
+
+from modules.transitions import transition_edges
+
+
+def build_graph(grid) -> tuple:
+    """
+    build forward and backward adjacency lists over (row, col, heading) states
+    """
+    forward, backward = {}, {}
+    for y, x, d, ny, nx, nd in transition_edges(grid).tolist():
+        forward.setdefault((y, x, d), []).append((ny, nx, nd))
+        backward.setdefault((ny, nx, nd), []).append((y, x, d))
+
+    return(forward, backward)
+
+
+def distances(graph, sources) -> dict:
+    """
+    breadth-first search from the given states, returns the number of moves to each state
+    """
+    dist = {state: 0 for state in sources}
+    queue = deque(sources)
+    while queue:
+        state = queue.popleft()
+        for nxt in graph.get(state, ()):
+            if nxt not in dist:
+                dist[nxt] = dist[state] + 1
+                queue.append(nxt)
+
+    return(dist)
+
+
+def reachability(env) -> list:
+    """
+    compute the time window of every state each train can occupy
+
+    returns one (states, earliest, latest, arrival) tuple per train:
+    states is an array of (row, col, heading) rows, earliest and latest bound the timesteps
+    at which the train can be at each state, and arrival is the earliest possible arrival
+    time at the target (None if the target cannot be reached in time)
+    """
+    forward, backward = build_graph(env.rail.grid)
+
+    windows = []
+    for agent_info in env.agents:
+        init_y, init_x = agent_info.initial_position
+        goal_y, goal_x = agent_info.target
+        min_start, max_end = agent_info.earliest_departure, agent_info.latest_arrival
+
+        # the first position is taken one step after the first action, which is at the earliest at ED-1 and at 0
+        spawn = max(int(min_start), 1)
+
+        to_state = distances(forward, [(int(init_y), int(init_x), int(agent_info.initial_direction))])
+        to_goal = distances(backward, [(int(goal_y), int(goal_x), d) for d in range(4)])
+
+        states = [s for s in to_state if s in to_goal and spawn + to_state[s] <= max_end - to_goal[s]]
+        earliest = np.array([spawn + to_state[s] for s in states], dtype=np.int64)
+        latest = np.array([max_end - to_goal[s] for s in states], dtype=np.int64)
+
+        arrivals = [earliest[i] for i, s in enumerate(states) if s[:2] == (goal_y, goal_x)]
+        arrival = int(min(arrivals)) if arrivals else None
+
+        windows.append((np.array(states, dtype=np.int64).reshape(-1, 3), earliest, latest, arrival))
+
+    return(windows)
+
+
+def expand_windows(states, earliest, latest) -> tuple:
+    """
+    expand state windows into one (row, col, heading, timestep) entry per timestep
+    """
+    lengths = latest - earliest + 1
+    index = np.repeat(np.arange(len(states)), lengths)
+    offset = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    timesteps = earliest[index] + offset
+
+    return(states[index, 0], states[index, 1], states[index, 2], timesteps)
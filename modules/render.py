@@ -0,0 +1,161 @@
+"""
+custom functions for rendering a simulation and writing its frames
+
+during the simulation, the state of every agent is recorded per timestep; afterwards, processes
+render ranges of frames from that record, and the frames are handed in order to a background
+thread through a bounded queue, which appends them to the animation as they come in
+"""
+
+import os
+import queue
+import threading
+import multiprocessing
+from collections import deque
+
+import numpy as np
+
+from flatland.envs.step_utils.states import TrainState
+
+# columns of an agent record, positions that are None are stored as -1
+record_columns = ["row", "col", "direction", "old_row", "old_col", "old_direction", "state", "malfunction"]
+
+
+class FrameWriter():
+    """
+    append frames to an animation file from a background thread
+    at most maxsize frames wait in memory, add() blocks while the queue is full
+    """
+
+    def __init__(self, filename, maxsize=16, format='GIF', loop=0, duration=240):
+        import imageio.v2 as imageio
+
+        self.writer = imageio.get_writer(filename, format=format, mode='I', loop=loop, duration=duration)
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        """ write frames until the None sentinel arrives """
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            if self.error is None:
+                try:
+                    self.writer.append_data(frame)
+                except Exception as e:
+                    # keep draining the queue so that add() never blocks, the error is raised on close()
+                    self.error = e
+
+    def add(self, frame) -> None:
+        """ queue a frame (an image array) for writing """
+        if self.error is not None:
+            raise self.error
+        self.queue.put(frame)
+
+    def close(self) -> None:
+        """ write the remaining frames and close the file """
+        self.queue.put(None)
+        self.thread.join()
+        self.writer.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def render_frame(env_renderer):
+    """ render the current state of the environment and return it as an image array """
+    env_renderer.render_env(show=True, show_observations=False, show_predictions=False)
+    frame = env_renderer.gl.get_image()
+    env_renderer.reset()
+    return(frame)
+
+
+def record_agents(env) -> np.ndarray:
+    """ record what the renderer needs of every agent as one row of record_columns per agent """
+    record = np.full((len(env.agents), len(record_columns)), -1, dtype=np.int32)
+    for i, agent in enumerate(env.agents):
+        if agent.position is not None:
+            record[i, 0:2] = agent.position
+        record[i, 2] = agent.direction
+        if agent.old_position is not None:
+            record[i, 3:5] = agent.old_position
+        if agent.old_direction is not None:
+            record[i, 5] = agent.old_direction
+        record[i, 6] = int(agent.state)
+        record[i, 7] = agent.malfunction_handler.malfunction_down_counter
+
+    return(record)
+
+
+def restore_agents(env, record) -> None:
+    """ set the agents of the environment to a record of record_agents """
+    for agent, (row, col, direction, old_row, old_col, old_direction, state, malfunction) in zip(env.agents, record.tolist()):
+        agent.position = None if row < 0 else (row, col)
+        agent.direction = direction
+        agent.old_position = None if old_row < 0 else (old_row, old_col)
+        agent.old_direction = None if old_direction < 0 else old_direction
+        agent.state = TrainState(state)
+        agent.malfunction_handler.malfunction_down_counter = malfunction
+
+
+# environment and renderer of a rendering process
+worker_env = None
+worker_renderer = None
+
+
+def init_worker(env) -> None:
+    """ keep one copy of the environment and one renderer per process """
+    # the renderer pulls in matplotlib, so it is only imported by processes that render
+    from flatland.utils.rendertools import RenderTool
+
+    global worker_env, worker_renderer
+    worker_env = env
+    worker_renderer = RenderTool(env, gl="PILSVG")
+    worker_renderer.reset()
+
+
+def render_records(records) -> list:
+    """ render one frame per record """
+    frames = []
+    for record in records:
+        restore_agents(worker_env, record)
+        frames.append(render_frame(worker_renderer))
+
+    return(frames)
+
+
+def render_states(env, states, writer, workers=None, chunk=8) -> None:
+    """
+    render the recorded states (one record_agents array per timestep) into the frame writer
+    ranges of chunk frames are rendered by a pool of processes and written in order
+    """
+    workers = workers or os.cpu_count()
+    ranges = [states[i:i+chunk] for i in range(0, len(states), chunk)]
+
+    if workers == 1:
+        init_worker(env)
+        for records in ranges:
+            for frame in render_records(records):
+                writer.add(frame)
+        return
+
+    # spawn, since the frame writer is a running thread; at most two ranges per process are pending
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(workers, initializer=init_worker, initargs=(env,)) as pool:
+        pending = deque()
+        for records in ranges:
+            pending.append(pool.apply_async(render_records, (records,)))
+            if len(pending) >= 2*workers:
+                for frame in pending.popleft().get():
+                    writer.add(frame)
+
+        while pending:
+            for frame in pending.popleft().get():
+                writer.add(frame)
@@ -1,8 +1,9 @@
 # functions for saving a Flatland environment as various file types
 
-from flatland.utils.rendertools import RenderTool, AgentRenderVariant
 import pickle
 
+from modules.envfile import save_env
+
 def save_lp(env, file_name, file_location):
     """ 
     save the clingo representation as an .lp file to be loaded later 
@@ -15,6 +16,9 @@ def save_png(env, file_name, file_location):
     """ 
     visually render a given environment and save image to file
     """
+    # the renderer pulls in matplotlib, so it is only imported when an image is saved
+    from flatland.utils.rendertools import RenderTool
+
     DO_RENDERING = True    
     env_renderer = RenderTool(env, gl="PILSVG")
     env_renderer.reset()
@@ -29,4 +33,11 @@ def save_pkl(env, file_name, file_location):
     """ 
     save a given rail environment metadata as a pickle file to be loaded later 
     """
-    pickle.dump(env, open(f"{file_location}pkl/{file_name}.pkl", "wb"))
\ No newline at end of file
+    pickle.dump(env, open(f"{file_location}pkl/{file_name}.pkl", "wb"))
+
+
+def save_npz(env, file_name, file_location):
+    """ 
+    save the arrays of a given rail environment as a compact .npz file to be loaded later 
+    """
+    save_env(f"{file_location}npz/{file_name}.npz", env)
@@ -0,0 +1,173 @@
+"""
+custom functions for timing the phases of a simulation
+
+a Tracer records named spans (converting facts, grounding, solving, stepping the environment,
+checking malfunctions, replanning, rendering, saving the log) together with the statistics of
+clingo for every solve; it exports them as a Chrome trace, which chrome://tracing and
+https://ui.perfetto.dev open, and as summary tables of the time per phase and of every solve
+
+spans are only recorded while a tracer is started, otherwise span() does nothing, so the phases
+stay instrumented in normal runs at almost no cost; spans of other processes, such as the racing
+solvers of modules/portfolio.py or the rendering pool, are not recorded
+"""
+
+import os
+import time
+import json
+import threading
+from contextlib import contextmanager
+
+# the tracer that spans are recorded by, None while tracing is off
+tracer = None
+
+# columns of the tables of phases and solves
+summary_columns = ["name", "count", "total", "mean", "max", "share"]
+solve_columns = ["name", "timestep", "status", "atoms", "rules", "choices", "conflicts", "cost", "ground_time", "solve_time"]
+
+
+class Tracer():
+    """ records spans and the statistics of solves, with times relative to its creation """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self.solves = []
+        self.pid = os.getpid()
+
+        # the arguments of the spans that are open, so that a solve knows e.g. the timestep of its replan
+        self.open = []
+
+    def add(self, name, start, end, args) -> None:
+        """ add a finished span, times are perf_counter values """
+        self.events.append({
+            "name": name,
+            "ph": "X",
+            "ts": (start - self.origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": self.pid,
+            "tid": threading.get_ident(),
+            "args": args
+        })
+
+    def add_solve(self, name, statistics, ground_time, solve_time, **args) -> None:
+        """ keep the statistics of a clingo control after solving as a row of the solve table """
+        summary = statistics["summary"]
+        models = summary["models"]
+        if summary["exhausted"] and not models["enumerated"]:
+            status = "unsat"
+        else:
+            status = "optimal" if models["optimal"] else "solved" if models["enumerated"] else "unknown"
+
+        context = {key: value for opened in self.open for key, value in opened.items()}
+        context.update(args)
+        row = {
+            "name": name,
+            "timestep": context.get("timestep", ""),
+            "status": status,
+            "atoms": int(statistics["problem"]["lp"]["atoms"]),
+            "rules": int(statistics["problem"]["lp"]["rules"]),
+            "choices": int(statistics["solving"]["solvers"]["choices"]),
+            "conflicts": int(statistics["solving"]["solvers"]["conflicts"]),
+            # without a model the costs are infinite
+            "cost": [int(c) for c in summary.get("costs", [])] if models["enumerated"] else [],
+            "ground_time": ground_time,
+            "solve_time": solve_time
+        }
+        self.solves.append(row)
+
+        # an instant event, so that the statistics show up at the end of the solve in the trace
+        self.events.append({"name": f"{name} statistics", "ph": "i", "s": "t", "ts": (time.perf_counter() - self.origin) * 1e6, "pid": self.pid, "tid": threading.get_ident(), "args": row})
+
+    def summary(self) -> list:
+        """ the count, total, mean and maximum seconds of each span name, longest total first """
+        events = [event for event in self.events if event["ph"] == "X"]
+        spans = {}
+        for event in events:
+            spans.setdefault(event["name"], []).append(event["dur"] / 1e6)
+
+        # the share is of the whole trace, nested spans are counted in their parents as well
+        elapsed = max([(event["ts"] + event["dur"]) / 1e6 for event in events] + [1e-9])
+        rows = [{"name": name, "count": len(times), "total": sum(times), "mean": sum(times) / len(times), "max": max(times), "share": sum(times) / elapsed} for name, times in spans.items()]
+        return(sorted(rows, key=lambda row: row["total"], reverse=True))
+
+    def save(self, path) -> None:
+        """ save trace.json, spans.csv and solves.csv into a directory """
+        with open(os.path.join(path, "trace.json"), "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+        save_table(os.path.join(path, "spans.csv"), summary_columns, self.summary())
+        save_table(os.path.join(path, "solves.csv"), solve_columns, self.solves)
+
+    def print_summary(self, limit=15) -> None:
+        """ print the phases that took longest, and the longest solve """
+        print(f"{'phase':<20} {'count':>6} {'total':>9} {'mean':>9} {'max':>9} {'share':>6}")
+        for row in self.summary()[:limit]:
+            print(f"{row['name']:<20} {row['count']:>6} {row['total']:>8.3f}s {row['mean']:>8.3f}s {row['max']:>8.3f}s {row['share']:>6.1%}")
+
+        if self.solves:
+            row = max(self.solves, key=lambda row: row["ground_time"] + row["solve_time"])
+            print(f"longest solve: {row['name']} at timestep {row['timestep'] or 0}, {row['atoms']} atoms, {row['rules']} rules, grounding {row['ground_time']:.3f}s, solving {row['solve_time']:.3f}s")
+
+
+def save_table(filename, columns, rows) -> None:
+    """ save rows of dicts as a csv table, like the results of batch.py """
+    with open(filename, "w") as f:
+        f.write(";".join(columns) + "\n")
+        for row in rows:
+            values = []
+            for column in columns:
+                value = row.get(column, "")
+                values.append(f"{value:.6f}" if isinstance(value, float) else str(value))
+            f.write(";".join(values) + "\n")
+
+
+def start() -> Tracer:
+    """ start recording spans and return the tracer """
+    global tracer
+    tracer = Tracer()
+    return(tracer)
+
+
+def stop() -> Tracer:
+    """ stop recording spans and return the tracer, if one was started """
+    global tracer
+    stopped, tracer = tracer, None
+    return(stopped)
+
+
+@contextmanager
+def span(name, **args):
+    """ record the time of the block as a span of the given name, if tracing is on """
+    if tracer is None:
+        yield
+        return
+
+    current = tracer
+    current.open.append(args)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.open.pop()
+        current.add(name, start, time.perf_counter(), args)
+
+
+def record_solve(name, ctl, ground_time, solve_time, **args) -> None:
+    """ keep the statistics of a solved control, if tracing is on """
+    # reading the statistics of clingo builds them as Python objects, which is only worth it when tracing
+    if tracer is not None:
+        tracer.add_solve(name, ctl.statistics, ground_time, solve_time, **args)
+
+
+@contextmanager
+def profiled(filename):
+    """ profile the block with cProfile and save the statistics, e.g. for snakeviz or pstats """
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(filename)
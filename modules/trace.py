@@ -0,0 +1,54 @@
+"""
+custom functions for the trace of a simulation
+
+every agent and timestep is one row of integer columns, which are saved as a compressed .npz file;
+positions off the map are stored as -1, and direction, state and action are stored as their
+Flatland codes, whose names are given below
+"""
+
+import numpy as np
+
+# integer columns of a trace and their types
+trace_columns = {"agent": np.int32, "timestep": np.int32, "row": np.int32, "col": np.int32, "direction": np.int8, "state": np.int8, "action": np.int8}
+
+# names of the codes, indexed by code
+dir_names = ['n', 'e', 's', 'w']
+state_names = ['waiting', 'ready to depart', 'malfunction (off map)', 'moving', 'stopped', 'malfunction (on map)', 'done']
+action_names = ['do_nothing', 'move_left', 'move_forward', 'move_right', 'wait']
+
+
+def save_trace(filename, trace) -> None:
+    """ save a dict of trace columns as a compressed .npz file """
+    np.savez_compressed(filename, **{name: np.asarray(trace[name], dtype=dtype) for name, dtype in trace_columns.items()})
+
+
+def trace_to_df(trace) -> "pd.DataFrame":
+    """
+    convert trace columns to a pandas dataframe
+    next to the integer columns, it has the columns of paths.csv: position as (row, col) tuples
+    (NaN off the map), and direction, status and given_command as categoricals
+    """
+    # pandas is only needed to read a trace, saving one does not import it
+    import pandas as pd
+
+    df = pd.DataFrame({name: np.asarray(trace[name], dtype=dtype) for name, dtype in trace_columns.items()})
+
+    df['position'] = [(row, col) if row >= 0 else np.nan for row, col in zip(df['row'].tolist(), df['col'].tolist())]
+
+    df['direction'] = pd.Categorical.from_codes(df['direction'], dir_names)
+    df['status'] = pd.Categorical.from_codes(df['state'], state_names)
+    df['given_command'] = pd.Categorical.from_codes(df['action'], action_names)
+    return(df)
+
+
+def load_trace(filename) -> "pd.DataFrame":
+    """ load a .npz trace as a pandas dataframe """
+    with np.load(filename) as trace:
+        return(trace_to_df(trace))
+
+
+def save_csv(filename, trace) -> None:
+    """ export trace columns in the format of paths.csv """
+    df = trace_to_df(trace)
+    df['position'] = [f"({row}, {col})" if row >= 0 else "" for row, col in zip(df['row'].tolist(), df['col'].tolist())]
+    df.to_csv(filename, sep=';', index=False, columns=['agent', 'timestep', 'position', 'direction', 'status', 'given_command'])
@@ -0,0 +1,93 @@
+"""
+custom functions for decoding Flatland track IDs
+
+a track ID is a 16-bit value made of four nibbles, one per heading of the train (n, e, s, w),
+from the most significant nibble down; within a nibble, the bits mark the headings
+the train may leave the cell with, in the same order
+"""
+
+import numpy as np
+
+# row and column offset when leaving a cell with heading n, e, s, w
+offsets = np.array([(-1,0), (0,1), (1,0), (0,-1)])
+
+
+def decode_tracks(tracks) -> np.ndarray:
+    """
+    decode track IDs into a boolean table indexed by [track, heading, new heading]
+    """
+    tracks = np.asarray(tracks, dtype=np.uint32).reshape(-1, 1)
+    bits = (tracks >> np.arange(15, -1, -1, dtype=np.uint32)) & 1
+    return(bits.reshape(-1, 4, 4).astype(bool))
+
+
+def transition_edges(grid) -> np.ndarray:
+    """
+    list every transition of the rail grid as rows of (row, col, heading, new row, new col, new heading)
+    only transitions that stay on the grid and lead onto track are kept
+    """
+    grid = np.asarray(grid)
+    rows, cols = np.nonzero(grid)
+
+    # decode each distinct track ID once, then look it up for every cell
+    tracks, inverse = np.unique(grid[rows, cols], return_inverse=True)
+    table = decode_tracks(tracks)[inverse.reshape(-1)]
+
+    cell, heading, new_heading = np.nonzero(table)
+    new_rows = rows[cell] + offsets[new_heading, 0]
+    new_cols = cols[cell] + offsets[new_heading, 1]
+
+    on_grid = (new_rows >= 0) & (new_rows < grid.shape[0]) & (new_cols >= 0) & (new_cols < grid.shape[1])
+    edges = np.stack([rows[cell], cols[cell], heading, new_rows, new_cols, new_heading], axis=1)[on_grid]
+    on_track = grid[edges[:, 3], edges[:, 4]] != 0
+
+    return(edges[on_track])
+
+
+def transition_moves(table) -> np.ndarray:
+    """
+    label the transitions of a decoded track table with the action that takes them
+    returns an array of action names indexed like the table ('' where there is no transition)
+
+    with a single way out of a heading, the train follows it with move_forward (curves, dead ends);
+    otherwise keeping the heading is move_forward and turning clockwise or counter-clockwise
+    is move_right or move_left
+    """
+    heading = np.arange(4).reshape(1, 4, 1)
+    new_heading = np.arange(4).reshape(1, 1, 4)
+    turn = (new_heading - heading) % 4
+
+    relative = np.array(["move_forward", "move_right", "move_forward", "move_left"])[turn]
+    single = table.sum(axis=2, keepdims=True) == 1
+    moves = np.where(single, "move_forward", relative)
+
+    return(np.where(table, moves, ""))
+
+
+def successor_edges(grid) -> tuple:
+    """
+    list every transition of the rail grid together with the action that takes it
+    returns the edges of transition_edges and an array with the action name of each edge
+    """
+    grid = np.asarray(grid)
+    edges = transition_edges(grid)
+
+    # label each distinct track ID once
+    tracks, inverse = np.unique(grid[edges[:, 0], edges[:, 1]], return_inverse=True)
+    moves = transition_moves(decode_tracks(tracks))
+
+    return(edges, moves[inverse.reshape(-1), edges[:, 2], edges[:, 5]])
+
+
+def track_transitions(grid) -> list:
+    """
+    list (track, heading, new heading, action) for every track ID that appears on the grid
+    the same information as asp/trans.lp, decoded from the track IDs themselves
+    """
+    tracks = np.unique(np.asarray(grid))
+    tracks = tracks[tracks != 0]
+    table = decode_tracks(tracks)
+    moves = transition_moves(table)
+
+    index, heading, new_heading = np.nonzero(table)
+    return(list(zip(tracks[index].tolist(), heading.tolist(), new_heading.tolist(), moves[index, heading, new_heading].tolist())))
@@ -1,14 +1,20 @@
 import os
 import re
+import functools
 
 import clingo
 import pandas as pd
 import numpy as np
 
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection, PathCollection
+from matplotlib.textpath import TextPath
+from matplotlib.transforms import Affine2D, IdentityTransform
 from datetime import datetime
 from PIL import Image
 
+from modules.trace import load_trace, dir_names, action_names
+
 
 # options for pandas to show all rows and columns
 pd.set_option('display.max_rows', None)
@@ -21,10 +27,11 @@ pd.set_option('display.max_colwidth', None)
 img_counter = 0
 
 
-def run_clingo(files):
+def run_clingo(files, options=()):
     """Run Clingo program with provided files.
 
-    Uses the given ASP files to run the program and return the answer set:
+    Uses the given ASP files to run the program and return the answer set,
+    with every model decoded by symbols_to_df:
 
     Example:
         run_clingo_program(
@@ -33,18 +40,20 @@ def run_clingo(files):
 
     Args:
         files: list of paths to asp files.
+        options: clingo command line options, e.g. from
+            modules.portfolio.solver_options(threads=4).
 
     Returns:
-        An answer set.
+        An answer set, as a list with a pandas dataframe per model.
     """
     # helper function for the solver
     def on_model(model):
-        # concat all atoms and separate with space
-        answer_str = " ".join(str(atom) for atom in model.symbols(shown=True))
+        # decode the atoms without turning them into a string
+        answer_df = symbols_to_df(model.symbols(shown=True))
         # append answer to answer set
-        answer_set.append(answer_str)
+        answer_set.append(answer_df)
 
-    ctl = clingo.Control()
+    ctl = clingo.Control(list(options))
 
     # load .lp files
     for file in files:
@@ -63,7 +72,7 @@ def run_clingo(files):
     # if len(answer_set) == 0:
     #     print('UNSATISFIABLE')
     # else:
-    #     # Print each answer set as a string
+    #     # Print each answer set as a dataframe
     #     for i, answer in enumerate(answer_set, 1):
     #         print(f"Answer {i}: \n{answer}\n")
 
@@ -150,6 +159,132 @@ def answer_to_df(answer):
     return df
 
 
+def symbols_to_df(symbols):
+    """Convert the symbols of a clingo model to a pandas dataframe.
+
+    Reads the position/4 and action/3 symbols straight into NumPy arrays,
+    without turning the model into a string. The result has the columns of
+    answer_to_df (agent, timestep, position, given_command), as well as the
+    row, col (-1 without a position) and direction of each train.
+
+    Every distinct train and cell is only decoded once through a dict, since
+    reading the arguments of a symbol is expensive.
+
+    Example:
+        symbols_to_df(model.symbols(shown=True))
+
+    Args:
+            symbols: list of clingo symbols, e.g. from model.symbols().
+
+    Returns:
+        A pandas dataframe sorted by agent and timestep.
+    """
+    # symbols of directions and commands to their codes
+    directions = {clingo.Function(name): code for code, name in enumerate(dir_names)}
+    commands = {clingo.Function(name): code for code, name in enumerate(action_names)}
+
+    # the arguments of every position and action
+    pos, act = [], []
+    for symbol in symbols:
+        if symbol.type != clingo.SymbolType.Function:
+            continue
+        name = symbol.name
+        if name == 'position':
+            pos.append(symbol.arguments)
+        elif name == 'action':
+            act.append(symbol.arguments)
+
+    # distinct cells and trains to their decoded values, numbers are read
+    # directly, since a dict lookup of a symbol costs as much as its number
+    cells, trains = {}, {}
+
+    def cell(symbol):
+        value = cells.get(symbol)
+        if value is None:
+            value = cells[symbol] = tuple(a.number for a in symbol.arguments)
+        return(value)
+
+    def train(symbol):
+        value = trains.get(symbol)
+        if value is None:
+            value = trains[symbol] = symbol.arguments[0].number
+        return(value)
+
+    # the columns are agent, timestep, row, col and direction
+    pos = np.array([(agent.number, time.number, *cell(position),
+                     directions.get(direction, -1))
+                    for agent, position, direction, time in pos],
+                   dtype=np.int64).reshape(-1, 5)
+    # the columns are agent, timestep and command
+    act = np.array([(train(agent), time.number, commands.get(command, -1))
+                    for agent, command, time in act],
+                   dtype=np.int64).reshape(-1, 3)
+
+    # join positions and actions on (agent, timestep) like an outer merge,
+    # timesteps are offset by the smallest one, since they can be negative,
+    # e.g. an action at ED-1 with ED = 0
+    first = min(pos[:, 1].min(initial=0), act[:, 1].min(initial=0))
+    stride = max(pos[:, 1].max(initial=0), act[:, 1].max(initial=0)) - first + 1
+    pos_keys = pos[:, 0] * stride + pos[:, 1] - first
+    act_keys = act[:, 0] * stride + act[:, 1] - first
+    keys = np.union1d(pos_keys, act_keys)
+
+    row = np.full(len(keys), -1, dtype=np.int64)
+    col = np.full(len(keys), -1, dtype=np.int64)
+    direction = np.full(len(keys), -1, dtype=np.int64)
+    command = np.full(len(keys), -1, dtype=np.int64)
+
+    index = np.searchsorted(keys, pos_keys)
+    row[index], col[index], direction[index] = pos[:, 2], pos[:, 3], pos[:, 4]
+    command[np.searchsorted(keys, act_keys)] = act[:, 2]
+
+    df = pd.DataFrame({
+        'agent': keys // stride,
+        'timestep': keys % stride + first,
+        'position': [(r, c) if r >= 0 else np.nan
+                     for r, c in zip(row.tolist(), col.tolist())],
+        'given_command': pd.Categorical.from_codes(command, action_names),
+        'row': row,
+        'col': col,
+        'direction': pd.Categorical.from_codes(direction, dir_names)
+    })
+
+    return df
+
+
+def stream_paths(files, options=()):
+    """Solve the given files and yield a dataframe for each model.
+
+    Like run_clingo, but every model is decoded by symbols_to_df as soon as
+    clingo reports it, without converting any answer set to a string.
+
+    Example:
+        for df in stream_paths(['asp/trans.lp', 'envs/lp/env_001--4_2.lp',
+                                'asp/flat.lp']):
+            plot_path(df, 'envs/png/env_001--4_2.png', (40, 40), 4)
+
+    Args:
+        files: list of paths to asp files.
+        options: clingo command line options, e.g. ['--models=1'].
+
+    Yields:
+        A pandas dataframe per model.
+    """
+    ctl = clingo.Control(list(options))
+
+    # load .lp files
+    for file in files:
+        ctl.load(file)
+
+    # ground the program
+    ctl.ground([("base", [])])
+
+    # decode the models while solving
+    with ctl.solve(yield_=True) as handle:
+        for model in handle:
+            yield symbols_to_df(model.symbols(shown=True))
+
+
 def convert_position(pos):
     """Convert a position string to an integer tuple.
 
@@ -183,22 +318,35 @@ def convert_position(pos):
 
 
 def import_paths(file):
-    """Import data from paths.csv.
+    """Import data from paths.npz or paths.csv.
+
+    The columnar paths.npz is loaded without any parsing. For paths.csv, the
+    positions are extracted with one vectorized pattern, which covers both
+    '(24, 4)' and the older '(np.int64(24), np.int64(4))'.
 
     Example:
-        import_paths('output/XXX.XXX/paths.csv')
+        import_paths('output/XXX.XXX/paths.npz')
 
     Args:
-            file: path to paths.csv.
+            file: path to paths.npz or paths.csv.
 
     Returns:
-        A pandas dataframe with the data from paths.csv.
+        A pandas dataframe with the data from the file.
     """
-    # import paths file to Dataframe
-    df = pd.read_csv(file, sep=';')
-
-    # convert position column to integer tuples
-    df['position'] = df['position'].apply(convert_position)
+    if file.endswith('.npz'):
+        df = load_trace(file)
+    else:
+        # import paths file to Dataframe
+        df = pd.read_csv(file, sep=';')
+
+        # convert position column to integer tuples
+        coords = df['position'].astype('string').str.extract(
+            r'\(?(?:np\.int64\()?(\d+)\)?, (?:np\.int64\()?(\d+)')
+        rows = coords[0].astype('Int64').tolist()
+        cols = coords[1].astype('Int64').tolist()
+        df['position'] = [
+            (row, col) if row is not pd.NA else np.nan
+            for row, col in zip(rows, cols)]
 
     # sort by agent and timestep
     df.sort_values(['agent', 'timestep'], inplace=True)
@@ -230,22 +378,18 @@ def get_grid_dimensions():
             print("Invalid input. Please enter integers.")
 
 
-def plot_path(df, env_image, grid_dim=None, border_width=None, ):
-    """Plot path of agents onto environment and save plot.
+@functools.lru_cache(maxsize=8)
+def load_background(env_image, border_width=None):
+    """Load and crop an environment image once.
 
-    Plots the path taken by the agents into a grid of grid_dim dimensions on
-    the environment. Also crops the white border out of the env_image according
-    to the specified border_width.
-    Plots will be saved in Plots folder under the time of program execution.
-
-    Example:
-        plot_path(data, (40, 40), 4, 'envs/png/env_001--4_2.png')
+    Later calls with the same arguments return the cached image.
 
     Args:
-            df: Dataframe with agent, timestep and position column
             env_image: path to env.png
-            grid_dim: tuple of dimensions of the environment grid (rows, cols)
             border_width: width of the white strip on env_image
+
+    Returns:
+        A NumPy array of the cropped image.
     """
     # Load environment image
     img = Image.open(env_image)
@@ -254,7 +398,43 @@ def plot_path(df, env_image, grid_dim=None, border_width=None, ):
     if border_width is not None:
         # noinspection PyTypeChecker
         img = img.crop([0, 0, img_width - border_width, img_height - border_width])
-        img_width, img_height = img.size
+
+    background = np.asarray(img)
+    background.setflags(write=False)
+    return background
+
+
+@functools.lru_cache(maxsize=None)
+def label_path(label, fontsize=2):
+    """Outline of a text label, centered on the origin, in points.
+
+    Args:
+            label: text of the label
+            fontsize: font size in points
+
+    Returns:
+        A matplotlib path.
+    """
+    path = TextPath((0, 0), label, size=fontsize)
+    extents = path.get_extents()
+    return path.transformed(Affine2D().translate(
+        -(extents.x0 + extents.x1) / 2, -(extents.y0 + extents.y1) / 2))
+
+
+def setup_plot(env_image, grid_dim=None, border_width=None):
+    """Create a figure with the environment and its grid.
+
+    Args:
+            env_image: path to env.png
+            grid_dim: tuple of dimensions of the environment grid (rows, cols)
+            border_width: width of the white strip on env_image
+
+    Returns:
+        The figure, its axes, and the (rows, cell_width, cell_height) of the
+        grid.
+    """
+    img = load_background(env_image, border_width)
+    img_height, img_width = img.shape[:2]
 
     # get environment dimensions
     if grid_dim is None:
@@ -272,56 +452,92 @@ def plot_path(df, env_image, grid_dim=None, border_width=None, ):
     cell_width = img_width / grid_cols
     cell_height = img_height / grid_rows
 
-    # grid lines
-    for i in range(grid_cols + 1):
-        ax.plot([i * cell_width, i * cell_width], [0, img_height],
-                color='black', lw=1)
-    for i in range(grid_rows + 1):
-        ax.plot([0, img_width], [i * cell_height, i * cell_height],
-                color='black', lw=1)
+    # grid lines as one collection
+    xs = np.arange(grid_cols + 1) * cell_width
+    ys = np.arange(grid_rows + 1) * cell_height
+    vertical = [[(x, 0), (x, img_height)] for x in xs]
+    horizontal = [[(0, y), (img_width, y)] for y in ys]
+    ax.add_collection(LineCollection(vertical + horizontal, colors='black', linewidths=1))
 
     # hide axis label
     ax.set_xticks([])
     ax.set_yticks([])
+    ax.set_xlim(0, img_width)
+    ax.set_ylim(0, img_height)
+
+    return fig, ax, (grid_rows, cell_width, cell_height)
+
+
+def draw_paths(ax, df, grid, labels=True):
+    """Draw the positions of all agents of a dataframe.
+
+    Pixel coordinates and the offsets within each cell are computed for all
+    positions at once. Each agent is drawn as one collection of timestep
+    labels, or as one scatter if labels is False.
+
+    Args:
+            ax: axes returned by setup_plot
+            df: Dataframe with agent, timestep and position column
+            grid: the (rows, cell_width, cell_height) returned by setup_plot
+            labels: write the timesteps (True) or only mark the positions
+
+    Returns:
+        A list of the added artists.
+    """
+    grid_rows, cell_width, cell_height = grid
+
+    # positions on the map, from row/col columns or position tuples
+    if 'row' in df.columns:
+        on_map = (df['row'] >= 0).to_numpy()
+        rows = df['row'].to_numpy()[on_map]
+        cols = df['col'].to_numpy()[on_map]
+    else:
+        on_map = df['position'].notna().to_numpy()
+        cells = np.array(df['position'][on_map].tolist(), dtype=float).reshape(-1, 2)
+        rows, cols = cells[:, 0], cells[:, 1]
+    agents = df['agent'].to_numpy()[on_map].astype(int)
+    timesteps = df['timestep'].to_numpy()[on_map]
+
+    # offset in each cell by agent
+    offsets_x = np.array([cell_width / 4, 0, -cell_width / 6, 0])
+    offsets_y = np.array([0, cell_height / 6, 0, -cell_height / 4])
+
+    # convert to pixel coordinates (adjusted for top-left origin)
+    xs = cols * cell_width + cell_width / 2 + offsets_x[agents % 4]
+    ys = (grid_rows - rows - 1) * cell_height + cell_height / 2 + offsets_y[agents % 4]
 
     agent_colors = plt.get_cmap('Set1', 10)
 
-    # plot timestep at agent position
-    for agent_id in df['agent'].unique():
-        # get data for agent
-        agent_df = df[df['agent'] == agent_id]
-
-        for _, row in agent_df.iterrows():
-            position = row['position']
-            if position is not np.nan:
-                x, y = position
-
-                # convert to pixel coordinates (adjusted for top-left origin)
-                pixel_x = y * cell_width
-                pixel_y = (grid_rows - x - 1) * cell_height
-
-                # get offset in each cell
-                offset_x, offset_y = 0, 0
-                if (agent_id % 4) == 0:
-                    offset_x = cell_width / 4
-                elif (agent_id % 4) == 1:
-                    offset_y = cell_height / 6
-                elif (agent_id % 4) == 2:
-                    offset_x = -cell_width / 6
-                elif (agent_id % 4) == 3:
-                    offset_y = -cell_height / 4
-
-                # plot timestep in agent color
-                ax.text(
-                    pixel_x + cell_width / 2 + offset_x,
-                    pixel_y + cell_height / 2 + offset_y,
-                    str(row["timestep"]),
-                    color=agent_colors(agent_id),
-                    ha='center',
-                    va='center',
-                    fontsize=2
-                )
+    artists = []
+    for agent_id in np.unique(agents):
+        mask = agents == agent_id
+        color = agent_colors(agent_id)
+        if labels:
+            # plot timestep in agent color, all labels of an agent as one
+            # collection of glyph outlines placed at the pixel coordinates
+            paths = [label_path(str(t)) for t in timesteps[mask].tolist()]
+            style = dict(sizes=[1], offsets=np.column_stack([xs[mask], ys[mask]]),
+                         transform=IdentityTransform(), facecolors=[color],
+                         edgecolors='none')
+            # matplotlib < 3.6 (doc/requirements.txt) only takes transOffset
+            if hasattr(PathCollection, 'set_offset_transform'):
+                collection = PathCollection(paths, **style)
+                collection.set_offset_transform(ax.transData)
+            else:
+                collection = PathCollection(paths, transOffset=ax.transData, **style)
+            artists.append(ax.add_collection(collection))
+        else:
+            artists.append(ax.scatter(xs[mask], ys[mask], color=color, s=1))
+
+    return artists
+
+
+def save_plot(fig, dpi=400):
+    """Save a figure to the Plots folder under time and image count.
 
+    Returns:
+        The filename of the plot.
+    """
     # Create a Plots folder if necessary
     folder = f'./Plots'
     os.makedirs(folder, exist_ok=True)
@@ -334,15 +550,72 @@ def plot_path(df, env_image, grid_dim=None, border_width=None, ):
     plot_time = plot_time.replace(":", "-")
 
     # save plot under time and image count
-    plt.savefig(f'{folder}/{plot_time}_{img_counter}', transparent=True,
-                bbox_inches='tight', dpi=400)
-    plt.close(fig)
+    filename = f'{folder}/{plot_time}_{img_counter}'
+    fig.savefig(filename, transparent=True, bbox_inches='tight', dpi=dpi)
 
     # increase image counter
     img_counter += 1
+    return filename
+
+
+def plot_path(df, env_image, grid_dim=None, border_width=None, labels=True, dpi=400):
+    """Plot path of agents onto environment and save plot.
+
+    Plots the path taken by the agents into a grid of grid_dim dimensions on
+    the environment. Also crops the white border out of the env_image according
+    to the specified border_width.
+    Plots will be saved in Plots folder under the time of program execution.
+
+    Example:
+        plot_path(data, 'envs/png/env_001--4_2.png', (40, 40), 4)
+
+    Args:
+            df: Dataframe with agent, timestep and position column
+            env_image: path to env.png
+            grid_dim: tuple of dimensions of the environment grid (rows, cols)
+            border_width: width of the white strip on env_image
+            labels: write the timesteps (True) or only mark the positions
+            dpi: resolution of the saved plot
+    """
+    plot_paths([df], env_image, grid_dim, border_width, labels, dpi)
     return
 
 
+def plot_paths(dfs, env_image, grid_dim=None, border_width=None, labels=True, dpi=400):
+    """Plot the paths of several runs onto one environment.
+
+    The figure, background and grid are created once; only the paths are
+    redrawn for each run, and each run is saved as its own plot.
+
+    Example:
+        plot_paths([import_paths(f) for f in files],
+                   'envs/png/env_001--4_2.png', (40, 40), 4)
+
+    Args:
+            dfs: iterable of Dataframes with agent, timestep and position column
+            env_image: path to env.png
+            grid_dim: tuple of dimensions of the environment grid (rows, cols)
+            border_width: width of the white strip on env_image
+            labels: write the timesteps (True) or only mark the positions
+            dpi: resolution of the saved plots
+
+    Returns:
+        A list of the filenames of the plots.
+    """
+    fig, ax, grid = setup_plot(env_image, grid_dim, border_width)
+
+    filenames = []
+    for df in dfs:
+        artists = draw_paths(ax, df, grid, labels)
+        filenames.append(save_plot(fig, dpi))
+
+        # remove the paths of this run
+        for artist in artists:
+            artist.remove()
+
+    plt.close(fig)
+    return filenames
+
 
 if __name__ == "__main__":
     print(f'Program Start: {datetime.now()}\n')
@@ -353,7 +626,7 @@ if __name__ == "__main__":
         'asp/flat.lp'
     ])
 
-    answer_data = answer_to_df(answers[0])
+    answer_data = answers[0]
     plot_path(answer_data, 'envs/png/env_001--4_2.png', (40, 40), 4)
 
     paths_data = import_paths(
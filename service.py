@@ -0,0 +1,265 @@
+# standard packages
+import os
+import sys
+import json
+import time
+import signal
+import importlib
+import itertools
+import threading
+import traceback
+import socketserver
+import multiprocessing
+from argparse import ArgumentParser, Namespace
+
+# custom modules
+import build
+from modules.client import default_socket
+
+
+# queue that workers announce the tasks they start on, so that the service can time them out
+started = None
+
+
+def init_worker(log, queue) -> None:
+    """ send the output of clingo to the service log, import Flatland once per process and keep encodings parsed """
+    global started
+    started = queue
+
+    # workers that the pool replaces are forked after the service's SIGTERM handler is set
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    with open(log, "a") as f:
+        os.dup2(f.fileno(), 1)
+        os.dup2(f.fileno(), 2)
+
+    import flatland.envs.rail_env
+    import flatland.utils.rendertools
+
+    # encodings are parsed again only when they change, like asp/params.py is read again for every job
+    import modules.api
+    modules.api.keep_parsed()
+
+
+def solve_task(task) -> dict:
+    """ solve one environment in a worker process and return its results row """
+    path, render, plan_only, stamp, token = task
+    started.put((token, os.getpid(), time.time()))
+
+    # imported here, so that asp/params.py is read again for every job and changes apply without a restart
+    import solve
+    import batch
+    importlib.reload(solve.params)
+
+    start = time.perf_counter()
+    try:
+        solve.check_params(solve.params)
+        if plan_only:
+            # all environments of a job share its output folder
+            actions = solve.plan_only(path, stamp, name=f"plan_{batch.job_name(path)}")
+            row = {"status": "solved" if actions else "unsat", "makespan": len(actions), "actions": sum(len(step) for step in actions)}
+        elif path.endswith(".lp"):
+            row = batch.solve_lp(path)
+        else:
+            row = batch.solve_pkl(path, render, stamp)
+    except Exception as e:
+        traceback.print_exc()
+        row = {"status": "error", "message": f"{type(e).__name__}: {e}"}
+
+    row["env"] = path
+    row["wall_time"] = time.perf_counter() - start
+    return(row)
+
+
+class Service():
+    """
+    runs build and solve jobs on a pool of worker processes that stay alive between jobs
+    every job emits progress events and ends with a result or an error event
+    """
+
+    def __init__(self, workers, log="tmp/service.log", timeout=600):
+        # fork before any thread of the server runs
+        context = multiprocessing.get_context("fork")
+        queue = context.Queue()
+        self.pool = context.Pool(workers, initializer=init_worker, initargs=(log, queue))
+        # build jobs take their numbers from the catalog, so only one may run at a time
+        self.build_lock = threading.Lock()
+
+        # seconds a solve task may run, and the (pid, start time) of every started task by its token
+        self.timeout = timeout
+        self.started = {}
+        self.tokens = itertools.count()
+        threading.Thread(target=self.watch, args=(queue,), daemon=True).start()
+
+    def watch(self, queue) -> None:
+        """ keep track of the tasks that the workers start """
+        while True:
+            token, pid, start = queue.get()
+            self.started[token] = (pid, start)
+
+    def run(self, line, emit) -> None:
+        """ run the job of one JSON line and pass its events to emit """
+        job = {}
+
+        def send(event):
+            if "id" in job:
+                event["id"] = job["id"]
+            emit(event)
+
+        try:
+            job = json.loads(line)
+            if not isinstance(job, dict):
+                raise ValueError("A job must be a JSON object")
+            kind = job.get("job")
+            if kind == "ping":
+                send({"event": "result", "pid": os.getpid()})
+            elif kind == "solve":
+                self.solve(job, send)
+            elif kind == "build":
+                self.build(job, send)
+            else:
+                raise ValueError(f"Unknown job '{kind}', expected ping, solve or build")
+        except Exception as e:
+            traceback.print_exc()
+            send({"event": "error", "message": f"{type(e).__name__}: {e}"})
+
+    def solve(self, job, send) -> None:
+        """
+        solve every environment of the job on the pool, results are sent as they finish
+        a task that runs longer than the timeout has its worker killed, which the pool replaces
+        """
+        envs = job["envs"] if "envs" in job else [job["env"]]
+        timeout = job.get("timeout", self.timeout)
+        stamp = time.time()
+        os.makedirs(f"output/{stamp}", exist_ok=True)
+
+        pending = {}
+        for path in envs:
+            token = next(self.tokens)
+            task = (path, job.get("render", True), job.get("plan_only", False), stamp, token)
+            pending[token] = (path, self.pool.apply_async(solve_task, (task,)))
+
+        rows = []
+        while pending:
+            for token, (path, result) in list(pending.items()):
+                row = self.check(path, result, self.started.get(token), timeout)
+                if row is None:
+                    continue
+                del pending[token]
+                self.started.pop(token, None)
+                rows.append(row)
+                send({"event": "progress", "done": len(rows), "total": len(envs), "row": row})
+            if pending:
+                time.sleep(0.1)
+
+        send({"event": "result", "output": f"output/{stamp}", "rows": rows})
+
+    def check(self, path, result, started, timeout) -> dict:
+        """ the results row of a task once it has finished, died or timed out, else None """
+        if result.ready():
+            return(result.get())
+        if started is None:
+            # still waiting for a free worker
+            return(None)
+
+        pid, start = started
+        try:
+            if time.time() - start < timeout:
+                # raises if the worker died, e.g. killed for using too much memory
+                os.kill(pid, 0)
+                return(None)
+            os.kill(pid, signal.SIGKILL)
+            row = {"status": "timeout"}
+        except ProcessLookupError:
+            row = {"status": "error", "message": "the worker process died"}
+
+        row["env"] = path
+        row["wall_time"] = time.time() - start
+        return(row)
+
+    def build(self, job, send) -> None:
+        """ build environments on the pool, like build.py """
+        options = {key: job[key] for key in ["start", "seed", "lp", "png", "pkl", "npz"] if key in job}
+        with self.build_lock:
+            # envs/params.py is read again, like by every run of build.py
+            importlib.reload(build.params)
+            build.check_params(build.params)
+
+            names = []
+            for result in build.build(job["amount"], pool=self.pool, **options):
+                if result["duplicate"] is None:
+                    names.append(result["file_name"])
+                send({"event": "progress", "file_name": result["file_name"], "seed": result["seed"], "attempts": result["attempts"], "duplicate": result["duplicate"]})
+
+        send({"event": "result", "names": names})
+
+    def close(self) -> None:
+        self.pool.terminate()
+        self.pool.join()
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """ read one JSON job per line from a connection and write its events back as JSON lines """
+
+    def handle(self):
+        def emit(event):
+            self.wfile.write((json.dumps(event) + "\n").encode())
+            self.wfile.flush()
+
+        for line in self.rfile:
+            if line.strip():
+                self.server.service.run(line, emit)
+
+
+def serve_stdin(service) -> None:
+    """ read jobs from stdin and write their events to stdout, e.g. for piping """
+    def emit(event):
+        print(json.dumps(event), flush=True)
+
+    for line in sys.stdin:
+        if line.strip():
+            service.run(line, emit)
+
+
+def get_args():
+    """ capture command line inputs """
+    parser = ArgumentParser()
+    parser.add_argument('--socket', type=str, default=default_socket, help=f'the Unix socket to listen on, {default_socket} by default')
+    parser.add_argument('--stdin', action='store_true', help='read jobs from stdin and write events to stdout instead of listening on a socket')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='the number of worker processes')
+    parser.add_argument('--log', type=str, default='tmp/service.log', help='the file that the output of the workers is appended to')
+    parser.add_argument('--timeout', type=float, default=600, help='the number of seconds after which a solve task is terminated, unless its job gives a timeout')
+    return(parser.parse_args())
+
+
+def main():
+    args: Namespace = get_args()
+    os.makedirs(os.path.dirname(os.path.abspath(args.log)), exist_ok=True)
+    service = Service(args.workers, args.log, args.timeout)
+
+    try:
+        if args.stdin:
+            serve_stdin(service)
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(args.socket)), exist_ok=True)
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+
+        with socketserver.ThreadingUnixStreamServer(args.socket, JobHandler) as server:
+            server.service = service
+            # stop on SIGTERM like on Ctrl+C
+            signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+            print(f"service listening on {args.socket} with {args.workers} workers", flush=True)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os.remove(args.socket)
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,23 +2,27 @@
 import warnings
 import os 
 import time
-import pickle
 import json
+from contextlib import nullcontext
 from argparse import ArgumentParser, Namespace
 
 # custom modules
 from asp import params
-from modules.api import FlatlandPlan, FlatlandReplan
+from modules.api import FlatlandPlan, FlatlandReplan, FlatlandSession
 from modules.convert import convert_malfunctions_to_clingo, convert_formers_to_clingo, convert_futures_to_clingo
+from modules.inject import formers_to_symbols, malfunctions_to_symbols, futures_to_symbols
+from modules.cache import GroundCache
+from modules.portfolio import solver_options, race
+from modules.render import FrameWriter, record_agents, render_states
+from modules.trace import trace_columns, save_trace, save_csv, action_names
+from modules.envfile import load_env, load_env_data
+from modules import spans
+from modules.spans import span
 
 # clingo
 import clingo
 from clingo.application import Application, clingo_main
 
-# rendering visualizations
-from flatland.utils.rendertools import RenderTool
-import imageio.v2 as imageio
-
 
 class MalfunctionManager():
     def __init__(self, num_agents):
@@ -56,26 +60,83 @@ class MalfunctionManager():
 
 
 class SimulationManager():
-    def __init__(self,env,primary,secondary=None):
+    def __init__(self,env,primary,secondary=None,inject=False,prune=False,successors=False,persistent=False,incremental=False,cache=None,options=(),portfolio=(),budget=None,replan_budget=None,optimize=False):
         self.env = env
         self.primary = primary
         if secondary is None:
             self.secondary = primary 
         else:
             self.secondary = secondary
+        self.inject = inject
+        self.prune = prune
+        self.successors = successors
+        self.persistent = persistent
+        self.incremental = incremental
+        self.cache = cache
+        self.options = list(options)
+        self.portfolio = list(portfolio)
+        self.budget = budget
+        self.replan_budget = replan_budget
+        # optimize plans until they are proven optimal, instead of keeping the first model
+        self.optimize = optimize
+        self.session = None
+
+        # seconds spent grounding and solving over all plans
+        self.ground_time = 0
+        self.solve_time = 0
+
+        # cost of the last plan, and whether it is proven optimal
+        self.cost = []
+        self.optimal = False
+
+    def record(self, app) -> None:
+        """ add the timings of a finished plan and keep its cost """
+        self.ground_time += app.ground_time
+        self.solve_time += app.solve_time
+        self.cost = app.cost
+        self.optimal = app.optimal
 
     def build_actions(self) -> list:
         """ create initial list of actions """
+        if self.persistent:
+            # ground once and keep the control for later updates
+            with span("plan"):
+                self.session = FlatlandSession(self.env, self.primary, prune=self.prune, successors=self.successors, options=self.options, optimize=self.optimize)
+                actions = self.session.solve(budget=self.budget)
+            self.record(self.session)
+            return(actions)
+
         # pass env, primary
-        app = FlatlandPlan(self.env, None)
-        clingo_main(app, self.primary)
+        # only initial plans use the ground program cache, replans depend on the context
+        with span("plan"):
+            return(self.plan(None, cache=self.cache, budget=self.budget))
+
+    def plan(self, context, cache=None, budget=None) -> list:
+        """ run FlatlandPlan, or race it over the portfolio of solver configurations """
+        plan_options = dict(inject=self.inject, prune=self.prune, successors=self.successors, incremental=self.incremental, cache=cache, budget=budget, optimize=self.optimize)
+        if self.portfolio:
+            # the racing processes record no spans of their own
+            with span("race", solvers=len(self.portfolio)):
+                app = race(self.env, context, self.primary, self.portfolio, **plan_options)
+        else:
+            app = FlatlandPlan(self.env, context, **plan_options)
+            clingo_main(app, self.primary + self.options)
+
+        self.record(app)
         return(app.action_list)
 
-    def provide_context(self, actions, timestep, malfunctions) -> str:
+    def provide_context(self, actions, timestep, malfunctions):
         """ provide additional facts when updating list """
         # actions that have already been executed
         # wait actions that are enforced because of malfunctions
         # future actions that were previously planned
+        if self.inject or self.persistent or self.incremental:
+            # (facts, required) symbols for the backend
+            past = formers_to_symbols(actions[:timestep+1])
+            malfs, waits = malfunctions_to_symbols(malfunctions, timestep)
+            future = futures_to_symbols(actions[timestep+1:])
+            return(malfs + future, past + waits)
+
         past = convert_formers_to_clingo(actions[:timestep+1])
         present = convert_malfunctions_to_clingo(malfunctions, timestep)
         future = convert_futures_to_clingo(actions[timestep+1:])
@@ -83,28 +144,47 @@ class SimulationManager():
 
     def update_actions(self, context) -> list:
         """ update list of actions following malfunction """
+        if self.persistent:
+            # the session only takes the required actions, facts cannot be added to a grounded program
+            solve_time = self.session.solve_time
+            actions = self.session.solve(context[1], budget=self.replan_budget)
+            self.solve_time += self.session.solve_time - solve_time
+            self.cost = self.session.cost
+            self.optimal = self.session.optimal
+            return(actions)
+
         # pass env, secondary, context
-        app = FlatlandPlan(self.env, context)
-        clingo_main(app, self.primary)
-        return(app.action_list)
+        return(self.plan(context, budget=self.replan_budget))
 
 
 class OutputLogManager():
     def __init__(self) -> None:
-        self.logs = []
+        self.logs = {name: [] for name in trace_columns}
 
-    def add(self,info) -> None:
-        """ add info from a timestep to the log """
-        self.logs.append(info)
+    def add(self, timestep, agents, step_actions) -> None:
+        """ add the agents that were given an action at a timestep to the log """
+        for a, command in step_actions.items():
+            agent = agents[a]
+            row, col = agent.position if agent.position is not None else (-1, -1)
+            for name, value in zip(trace_columns, (a, timestep, row, col, agent.direction, int(agent.state), int(command))):
+                self.logs[name].append(int(value))
+
+    def save(self, filename, csv=False) -> None:
+        """ save output log to local drive, as paths.npz and optionally as paths.csv (see modules/trace.py) """
+        save_trace(f"output/{filename}/paths.npz", self.logs)
+        if csv:
+            save_csv(f"output/{filename}/paths.csv", self.logs)
+
+# encodings that only find plans with the facts of these flags, without them they ground to nothing
+required_flags = {
+    "flat_pruned.lp": ["prune"],
+    "flat_succ.lp": ["successors"],
+    "compact.lp": ["prune", "successors"]
+}
+
+# parameters that a persistent session would ignore
+persistent_conflicts = ["portfolio", "incremental", "cache"]
 
-    def save(self,filename) -> None:
-        """ save output log to local drive """
-        #with open(f"output/{filename}/paths.json", "w") as f:
-        #    f.write(json.dumps(self.logs))
-        with open(f"output/{filename}/paths.csv", "w") as f:
-            f.write("agent;timestep;position;direction;status;given_command\n")
-            for log in self.logs:
-                f.write(log)
 
 def check_params(par):
     """
@@ -114,6 +194,21 @@ def check_params(par):
         "primary": list
         #"secondary": list
     }
+    optional_params = {
+        "inject": bool,
+        "prune": bool,
+        "successors": bool,
+        "persistent": bool,
+        "incremental": bool,
+        "cache": bool,
+        "cache_size": int,
+        "threads": int,
+        "configuration": str,
+        "opt_strategy": str,
+        "portfolio": list,
+        "budget": (int, float),
+        "replan_budget": (int, float)
+    }
 
     # check that all required parameters exist and have the correct type
     for param, expected_type in required_params.items():
@@ -127,43 +222,67 @@ def check_params(par):
             if not isinstance(value, expected_type):
                 raise TypeError(f"Parameter '{param}' should be of type {expected_type.__name__}, but got {type(value).__name__}")
 
+    # optional parameters only need the correct type if they exist
+    for param, expected_type in optional_params.items():
+        if hasattr(par, param) and getattr(par, param) is not None and not isinstance(getattr(par, param), expected_type):
+            names = " or ".join(t.__name__ for t in expected_type) if isinstance(expected_type, tuple) else expected_type.__name__
+            raise TypeError(f"Parameter '{param}' should be of type {names}, but got {type(getattr(par, param)).__name__}")
+
+    # encodings whose facts are switched off
+    for encoding in list(par.primary) + list(getattr(par, 'secondary', None) or []):
+        missing = [flag for flag in required_flags.get(os.path.basename(encoding), []) if not getattr(par, flag, False)]
+        if missing:
+            raise ValueError(f"Encoding '{encoding}' needs {' and '.join(f'{flag}=True' for flag in missing)} in the params module")
+
+    # the persistent session grounds once through the backend, so it cannot race, ground incrementally or cache
+    if getattr(par, 'persistent', False):
+        conflicts = [param for param in persistent_conflicts if getattr(par, param, None)]
+        if conflicts:
+            raise ValueError(f"Parameter 'persistent' cannot be combined with {' or '.join(conflicts)} in the params module")
+
     return True
 
 
 def get_args():
     """ capture command line inputs """
     parser = ArgumentParser()
-    parser.add_argument('env', type=str, default='', nargs=1, help='the flatland environment as a .pkl file')
+    parser.add_argument('env', type=str, default='', nargs=1, help='the flatland environment as a .pkl or .npz file')
+    parser.add_argument('--workers', type=int, default=None, help='the number of processes rendering frames, defaults to the number of cores')
+    parser.add_argument('--csv', action='store_true', help='export the output log as paths.csv next to paths.npz')
+    parser.add_argument('--plan-only', action='store_true', help='only compute the initial plan and save it as plan.json, without simulating or rendering')
+    parser.add_argument('--trace', action='store_true', help='time the phases of the run and save them as trace.json, spans.csv and solves.csv')
+    parser.add_argument('--profile', action='store_true', help='profile the run with cProfile and save the statistics as profile.prof')
     return(parser.parse_args())
 
 
-def main():
-    # dev test main
-    if check_params(params):
-        args: Namespace = get_args()
-        env = pickle.load(open(args.env[0], "rb"))
-
-    # create manager objects
-    mal = MalfunctionManager(env.get_num_agents())
-    sim = SimulationManager(env, params.primary, params.secondary)
-    log = OutputLogManager()
+def build_manager(env, par=params) -> SimulationManager:
+    """
+    create a simulation manager with the encodings and options of asp/params.py,
+    or of any other object with the same attributes, such as a SolveConfig of modules/pipeline.py
+    """
+    cache = GroundCache(max_size=getattr(par, 'cache_size', 512*1024**2)) if getattr(par, 'cache', False) else None
+    options = solver_options(getattr(par, 'threads', 1), getattr(par, 'configuration', None), getattr(par, 'opt_strategy', None))
+    # competing threads only pay off when they search for the optimum, not for the first model
+    optimize = getattr(par, 'threads', 1) > 1
+    return(SimulationManager(env, par.primary, getattr(par, 'secondary', None), inject=getattr(par, 'inject', False), prune=getattr(par, 'prune', False), successors=getattr(par, 'successors', False), persistent=getattr(par, 'persistent', False), incremental=getattr(par, 'incremental', False), cache=cache, options=options, portfolio=getattr(par, 'portfolio', []), budget=getattr(par, 'budget', None), replan_budget=getattr(par, 'replan_budget', None), optimize=optimize))
 
-    # envrionment rendering
-    env_renderer = RenderTool(env, gl="PILSVG")
-    env_renderer.reset()
-    images = []
 
-    # create directory
-    os.makedirs("tmp/frames", exist_ok=True)
-    action_map = {1:'move_left',2:'move_forward',3:'move_right',4:'wait'}
-    state_map = {0:'waiting', 1:'ready to depart', 2:'malfunction (off map)', 3:'moving', 4:'stopped', 5:'malfunction (on map)', 6:'done'}
-    dir_map = {0:'n', 1:'e', 2:'s', 3:'w'}
+def simulate(env, sim, log) -> tuple:
+    """
+    execute the plan of the simulation manager in the environment and replan after malfunctions
+    returns the final list of actions, whether all trains are done,
+    and the state of the agents at every timestep for rendering (see modules/render.py)
+    """
+    mal = MalfunctionManager(env.get_num_agents())
+    states = []
 
     actions = sim.build_actions()
 
     timestep = 0
+    done = {'__all__': False}
     while len(actions) > timestep:
-        _, _, done, info = env.step(actions[timestep])
+        with span("step"):
+            _, _, done, info = env.step(actions[timestep])
 
         # end if simulation is finished
         if done['__all__'] and timestep < len(actions)-1:
@@ -171,35 +290,95 @@ def main():
             break
 
         # check for new malfunctions
-        new_malfs = mal.check(info)
+        with span("malfunctions"):
+            new_malfs = mal.check(info)
 
         if len(new_malfs) > 0:
-            context = sim.provide_context(actions, timestep, mal.get())
-            actions = sim.update_actions(context)
+            with span("replan", timestep=timestep, malfunctions=len(new_malfs)):
+                context = sim.provide_context(actions, timestep, mal.get())
+                actions = sim.update_actions(context)
 
         mal.deduct() #??? where in the loop should this go - before context?
 
-        # render an image
-        filename = 'tmp/frames/flatland_frame_{:04d}.png'.format(timestep)
-        if env_renderer is not None:
-            env_renderer.render_env(show=True, show_observations=False, show_predictions=False)
-            env_renderer.gl.save_image(filename)
-            env_renderer.reset()
-        images.append(imageio.imread(filename))
+        # record the agents, frames are rendered after the simulation
+        with span("record"):
+            states.append(record_agents(env))
 
         # add to the log
-        for a in actions[timestep]:
-            log.add(f'{a};{timestep};{env.agents[a].position};{dir_map[env.agents[a].direction]};{state_map[env.agents[a].state]};{action_map[actions[timestep][a]]}\n')
+        with span("log"):
+            log.add(timestep, env.agents, actions[timestep])
 
         timestep = timestep + 1
 
-    # combine images into gif
-    stamp = time.time()
+    return(actions, done['__all__'], states)
+
+
+def plan_only(filename, stamp=None, name="plan") -> list:
+    """
+    compute the initial plan of an environment without simulating it, and save it as output/<stamp>/<name>.json
+    an .npz environment is planned from its arrays, without importing Flatland's environment
+    """
+    with span("load env"):
+        env = load_env_data(filename) if filename.endswith(".npz") else load_env(filename)
+    sim = build_manager(env)
+    actions = sim.build_actions()
+
+    stamp = stamp or time.time()
+    os.makedirs(f"output/{stamp}", exist_ok=True)
+    with open(f"output/{stamp}/{name}.json", "w") as f:
+        json.dump([{str(agent): action_names[int(action)] for agent, action in step.items()} for step in actions], f)
+
+    print(f"plan of {len(actions)} steps saved to output/{stamp}/{name}.json (grounding {sim.ground_time:.3f}s, solving {sim.solve_time:.3f}s)")
+    return(actions)
+
+
+def run_env(args, stamp) -> None:
+    """ simulate, render and log an environment into output/<stamp> """
+    with span("load env"):
+        env = load_env(args.env[0])
+
+    # create manager objects
+    sim = build_manager(env)
+    log = OutputLogManager()
+
+    with span("simulate"):
+        _, _, states = simulate(env, sim, log)
+
+    # render the recorded states in parallel
     os.makedirs(f"output/{stamp}", exist_ok=True)
-    imageio.mimsave(f"output/{stamp}/animation.gif", images, format='GIF', loop=0, duration=240)
+    with span("render", frames=len(states)), FrameWriter(f"output/{stamp}/animation.gif") as writer:
+        render_states(env, states, writer, args.workers)
 
     # save output log
-    log.save(stamp)
+    with span("save log"):
+        log.save(stamp, csv=args.csv)
+
+
+def main():
+    # dev test main
+    if check_params(params):
+        args: Namespace = get_args()
+
+    # the outputs of the run and of its trace share one folder
+    stamp = time.time()
+    if args.trace or args.profile:
+        os.makedirs(f"output/{stamp}", exist_ok=True)
+    if args.trace:
+        spans.start()
+
+    with spans.profiled(f"output/{stamp}/profile.prof") if args.profile else nullcontext():
+        if args.plan_only:
+            plan_only(args.env[0], stamp)
+        else:
+            run_env(args, stamp)
+
+    tracer = spans.stop()
+    if tracer is not None:
+        tracer.save(f"output/{stamp}")
+        tracer.print_summary()
+        print(f"trace saved to output/{stamp}/trace.json, open it in https://ui.perfetto.dev")
+    if args.profile:
+        print(f"profile saved to output/{stamp}/profile.prof, e.g. python -m pstats output/{stamp}/profile.prof")
 
 
 if __name__ == "__main__":